@@ -1,3 +1,6 @@
+import os
+import uuid
+from datetime import timedelta
 import streamlit as st
 import pandas as pd
 import plotly.express as px
@@ -5,7 +8,12 @@ import plotly.graph_objects as go
 import matplotlib.pyplot as plt
 import seaborn as sns
 from wordcloud import WordCloud
-import preprocessor, helper
+import preprocessor, backends, exports, features, parse_cache, profiling, sentiment, chat_store
+from chat_index import ChatIndex
+
+# Analysis engine (pandas unless CHAT_BACKEND names another); every helper
+# call from the display functions is timed as a profiling stage
+helper = profiling.Instrumented(backends.get_backend())
 
 # —————————— GLOBAL PAGE CONFIG & CSS ——————————
 st.set_page_config(
@@ -60,6 +68,149 @@ st.markdown(
     unsafe_allow_html=True,
 )
 
+# —————————— PARSING & CACHE ——————————
+@st.cache_resource
+def get_parse_cache():
+    # Set CHAT_CACHE_DIR to also keep parsed chats on disk between restarts
+    return parse_cache.ParseCache(
+        cache_dir=os.environ.get("CHAT_CACHE_DIR"),
+        columns=["date_time", "user", "message", *features.feature_columns],
+    )
+
+@st.cache_resource
+def get_score_store():
+    # Sentiment scores are shared across sessions; on disk next to the parse cache
+    cache_dir = os.environ.get("CHAT_CACHE_DIR")
+    if not cache_dir:
+        return sentiment.default_store
+    os.makedirs(cache_dir, exist_ok=True)
+    return sentiment.ScoreStore(path=os.path.join(cache_dir, "sentiment.sqlite"))
+
+@st.cache_resource
+def get_chat_store():
+    # Chats by session and name, for merging newer exports into the ones parsed before
+    return chat_store.ChatStore(cache=get_parse_cache())
+
+def merge_scope():
+    # Stored chats are matched by file name, so each browser session only
+    # merges into (and sees) the chats it uploaded itself
+    if "merge_scope" not in st.session_state:
+        st.session_state["merge_scope"] = uuid.uuid4().hex
+    return st.session_state["merge_scope"]
+
+@st.cache_resource(max_entries=8)
+def load_chat(chat_key, scope, _uploaded_file):
+    # Parse (or fetch) the chat and build its per-user index once per upload;
+    # with a scope, the upload is merged into that session's stored chat
+    if scope is not None:
+        with profiling.stage("ingest") as record:
+            identity = f"{scope}/{exports.chat_identity(_uploaded_file.name)}"
+            chat, record["rows"] = get_chat_store().ingest(identity, _uploaded_file, key=chat_key)
+    else:
+        # Uploads are parsed compact; the flag is part of the cache key
+        df = get_parse_cache().get_or_parse(f"{chat_key}-compact", lambda: parse_upload(_uploaded_file))
+        chat = ChatIndex(df, key=chat_key)
+    # Count cube behind every timeline/activity chart, built in one pass now
+    chat.time_cube
+    return chat
+
+def parse_upload(uploaded_file):
+    # Decode and parse line by line (from the chat member of a .zip export
+    # too) instead of materializing the whole text
+    with exports.open_chat(uploaded_file) as text, profiling.stage("preprocess") as record:
+        df = preprocessor.preprocess_stream(text, compact=True)
+        record["rows"] = len(df)
+    return df
+
+# Preset windows in days (None: the whole chat)
+date_ranges = {"All time": None, "Last 30 days": 30, "Last 90 days": 90, "Last year": 365}
+
+@st.cache_resource(max_entries=16)
+def load_window(chat_key, start, end, _chat):
+    # Messages from start to end (inclusive dates) as a slice of the chat
+    return _chat.window(pd.Timestamp(start), pd.Timestamp(end) + pd.Timedelta(days=1))
+
+def select_window(chat):
+    if not len(chat):
+        return chat
+    cube = chat.time_cube
+    first = cube.first_day.astype(object)
+    last = (cube.first_day + cube.n_days - 1).astype(object)
+
+    choice = st.sidebar.selectbox(
+        "Date Range",
+        options=list(date_ranges) + ["Custom"],
+        help="Analyze only the messages sent in this period.",
+    )
+    if choice == "Custom":
+        picked = st.sidebar.date_input(
+            "From / To", value=(first, last), min_value=first, max_value=last, key=f"date_window_{chat.key}"
+        )
+        if len(picked) < 2:
+            # The end date hasn't been picked yet
+            return chat
+        start, end = picked
+    elif date_ranges[choice] is None:
+        return chat
+    else:
+        start, end = max(first, last - timedelta(days=date_ranges[choice] - 1)), last
+
+    window = load_window(chat.key, start, end, chat)
+    if not len(window):
+        st.sidebar.warning("No messages in this period; showing the whole chat.")
+        return chat
+    return window
+
+sections = ["Timeline & Activity", "Text Overview", "Extra Insights", "Conversations"]
+max_chart_points = 1000
+# Silence that ends a conversation session
+session_gap_minutes = 30
+
+@st.cache_resource(max_entries=64)
+def section_data(chat_key, selected_user, section, _df):
+    # Helper results behind one dashboard section, computed the first time
+    # the section is shown for this chat and user and reused afterwards
+    df = _df
+    if section == "Stats":
+        return {"stats": helper.fetch_stats(df, selected_user)}
+    if section == "Timeline & Activity":
+        return {
+            # Chart data is reduced to a bounded number of points here, not in the browser
+            "monthly": helper.downsample(helper.monthly_timeline(selected_user, df), max_points=max_chart_points),
+            "daily": helper.resample_timeline(helper.daily_timeline(selected_user, df), max_points=max_chart_points),
+            "busy_day": helper.week_activity_map(selected_user, df),
+            "busy_month": helper.month_activity_map(selected_user, df),
+            "heatmap": helper.activity_heatmap(selected_user, df),
+            "busy_users": helper.most_busy_users(df) if selected_user == 'Overall' else None,
+        }
+    if section == "Text Overview":
+        if selected_user == 'group_notification':
+            words = {"wordcloud": None, "common_words": None}
+        else:
+            words = {
+                "wordcloud": helper.create_wordcloud(selected_user, df),
+                "common_words": helper.most_common_words(selected_user, df),
+            }
+        return {
+            **words,
+            "emojis": helper.emoji_helper(selected_user, df),
+            "domains": helper.top_domains(selected_user, df),
+        }
+    if section == "Conversations":
+        return {
+            "sessions": helper.session_stats(selected_user, df, session_gap_minutes),
+            "latency": helper.reply_latency(df, session_gap_minutes),
+            "replies": helper.reply_pairs(df, session_gap_minutes),
+        }
+    return {
+        "avg_per_day": helper.average_messages_per_day(selected_user, df),
+        "hourly": helper.hourly_activity(selected_user, df),
+        "day_of_month": helper.day_of_month_activity(selected_user, df),
+        "message_lengths": helper.message_length_histogram(selected_user, df, bins=30),
+        "richness": helper.lexical_richness(selected_user, df),
+        "sentiment": helper.sentiment_analysis(selected_user, df, store=get_score_store()),
+    }
+
 # —————————— SIDEBAR ——————————
 
 def load_sidebar():
@@ -183,19 +334,27 @@ def load_sidebar():
 
     uploaded_file = st.sidebar.file_uploader(
         "📁",
-        type=["txt"],
-        help="Export your chat from WhatsApp and upload the .txt file here.",
+        type=["txt", "zip"],
+        help="Export your chat from WhatsApp and upload the .txt file (or the .zip export) here.",
         label_visibility="collapsed",
     )
 
     df = None
     if uploaded_file:
         st.success("✅ File uploaded successfully!")
-        bytes_data = uploaded_file.getvalue().decode("utf-8")
-        df = preprocessor.preprocessor(bytes_data)
-
-        # Assuming df has a 'user' column to select from, else adapt this
-        users = df['user'].unique().tolist() if df is not None else []
+        with uploaded_file.getbuffer() as buffer:
+            chat_key = parse_cache.content_hash(buffer)
+        merge = st.sidebar.checkbox(
+            "Merge with earlier exports",
+            help="Add only the new messages of this export to the copy of the chat "
+                 "(same file name) uploaded before, and analyze the combined history.",
+        )
+        chat = load_chat(chat_key, merge_scope() if merge else None, uploaded_file)
+        if not len(chat):
+            st.sidebar.error("No messages found; is this a WhatsApp chat export?")
+            return None, None, False
+        df = select_window(chat)
+        users = df.users
 
         selected_user = st.sidebar.selectbox(
             "Select User",
@@ -204,11 +363,13 @@ def load_sidebar():
             help="Select a user to analyze specific chat data."
         )
 
-        show_analysis = st.sidebar.button("Show Analysis")
+        if st.sidebar.button("Show Analysis"):
+            st.session_state["analysis_chat"] = chat_key
 
-        if show_analysis:
-            # You can return a tuple (df, selected_user, show_analysis)
-            return df, selected_user, show_analysis
+        # The analysis stays open across reruns (switching sections or users)
+        # until a different chat is uploaded
+        show_analysis = st.session_state.get("analysis_chat") == chat_key
+        return df, selected_user, show_analysis
 
     return df, None, False
 
@@ -302,8 +463,8 @@ def show_analysis_button():
     return st.sidebar.button("🚀 Show Analysis", use_container_width=True)
 
 # —————————— TOP METRICS ——————————
-def display_stats(selected_user, df):
-    num_messages, words, media_messages, links = helper.fetch_stats(df, selected_user)
+def display_stats(stats):
+    num_messages, words, media_messages, links = stats
     st.markdown('<div class="title">🔍 Top-Level Stats</div>', unsafe_allow_html=True)
     
     col1, col2, col3, col4 = st.columns(4)
@@ -346,13 +507,12 @@ def plot_timeline(title, timeline, x_col, y_col, marker_color):
     st.plotly_chart(fig, use_container_width=True)
 
 # —————————— ACTIVITY MAP ——————————
-def plot_activity_map(selected_user, df):
+def plot_activity_map(busy_day, busy_month):
     st.markdown('<div class="title">📅 Activity Overview</div>', unsafe_allow_html=True)
     col1, col2 = st.columns(2, gap="large")
 
     with col1:
         st.subheader("Busy Days of Week")
-        busy_day = helper.week_activity_map(selected_user, df)
         fig = go.Figure([go.Bar(x=busy_day.index, y=busy_day.values, marker_color='indigo')])
         fig.update_layout(
             xaxis_title='Day of Week',
@@ -363,7 +523,6 @@ def plot_activity_map(selected_user, df):
 
     with col2:
         st.subheader("Busy Months")
-        busy_month = helper.month_activity_map(selected_user, df)
         fig = go.Figure([go.Bar(x=busy_month.index, y=busy_month.values, marker_color='crimson')])
         fig.update_layout(
             xaxis_title='Month',
@@ -372,9 +531,8 @@ def plot_activity_map(selected_user, df):
         )
         st.plotly_chart(fig, use_container_width=True)
 
-def plot_weekly_activity_heatmap(selected_user, df):
+def plot_weekly_activity_heatmap(heatmap_data):
     st.subheader("Weekly Heatmap")
-    heatmap_data = helper.activity_heatmap(selected_user, df)
     fig, ax = plt.subplots(figsize=(8, 4))
     sns.heatmap(
         heatmap_data, 
@@ -390,9 +548,9 @@ def plot_weekly_activity_heatmap(selected_user, df):
 
 # —————————— BUSY USERS (ONLY “Overall”) ——————————
 
-def display_busy_users(df):
+def display_busy_users(busy_users):
     st.markdown('<div class="title">👥 Most Active Participants</div>', unsafe_allow_html=True)
-    x, new_df = helper.most_busy_users(df)  # x is a Series: index = usernames, values = counts
+    x, new_df = busy_users  # x is a Series: index = usernames, values = counts
 
     # Matplotlib Chart (Perfect as is)
     st.subheader("Matplotlib Chart")
@@ -409,26 +567,24 @@ def display_busy_users(df):
     st.dataframe(new_df.style.background_gradient(cmap="Blues", subset=[second_col]),use_container_width=True)
 
 # —————————— WORDCLOUD & COMMON WORDS ——————————
-def display_wordcloud(selected_user, df):
+def display_wordcloud(selected_user, df_wc):
     if selected_user == 'group_notification':
         st.info("Wordcloud is not available for group notifications.")
         return
 
     st.markdown('<div class="title">☁️ Wordcloud</div>', unsafe_allow_html=True)
-    df_wc = helper.create_wordcloud(selected_user, df)
     fig, ax = plt.subplots(figsize=(8, 4))
     ax.imshow(df_wc, interpolation="bilinear")
     ax.axis("off")
     plt.tight_layout()
     st.pyplot(fig)
 
-def display_common_words(selected_user, df):
+def display_common_words(selected_user, common_words_df):
     if selected_user == 'group_notification':
         st.info("Common words analysis is not available for group notifications.")
         return
 
     st.markdown('<div class="title">📝 Most Common Words</div>', unsafe_allow_html=True)
-    common_words_df = helper.most_common_words(selected_user, df)
     fig, ax = plt.subplots(figsize=(6, 4))
     ax.barh(common_words_df[0], common_words_df[1], color="#3498DB")
     ax.set_ylabel("Words")
@@ -438,9 +594,8 @@ def display_common_words(selected_user, df):
 
 
 # —————————— EMOJI ANALYSIS ——————————
-def display_emoji_analysis(selected_user, df):
+def display_emoji_analysis(emoji_df):
     st.markdown('<div class="title">😀 Emoji Analysis</div>', unsafe_allow_html=True)
-    emoji_df = helper.emoji_helper(selected_user, df)
 
     if not isinstance(emoji_df, pd.DataFrame):
         st.write(emoji_df)
@@ -461,17 +616,31 @@ def display_emoji_analysis(selected_user, df):
             )
             st.plotly_chart(pie_fig, use_container_width=True)
 
+# —————————— SHARED LINKS ——————————
+def display_top_domains(domains_df):
+    st.markdown('<div class="title">🔗 Top Shared Domains</div>', unsafe_allow_html=True)
+
+    if not isinstance(domains_df, pd.DataFrame):
+        st.write(domains_df)
+    else:
+        fig = go.Figure([go.Bar(x=domains_df[1], y=domains_df[0], orientation='h', marker_color='#2980B9')])
+        fig.update_layout(
+            xaxis_title='Links',
+            yaxis_title='Domain',
+            yaxis=dict(autorange='reversed'),
+            margin=dict(t=30, b=20, l=20, r=20)
+        )
+        st.plotly_chart(fig, use_container_width=True)
+
 # —————————— AVERAGES & HOURLY ACTIVITY ——————————
-def display_avg_messages(selected_user, df):
-    avg_per_day = helper.average_messages_per_day(selected_user, df)
+def display_avg_messages(avg_per_day):
     st.markdown('<div class="metric-card" style="margin-top:1rem;">', unsafe_allow_html=True)
     st.subheader("📈 Avg. Messages / Day")
     st.markdown(f"### {round(avg_per_day, 2)}")
     st.markdown('</div>', unsafe_allow_html=True)
 
-def display_hourly_activity(selected_user, df):
+def display_hourly_activity(hourly_df):
     st.markdown('<div class="title">⏰ Hourly Activity</div>', unsafe_allow_html=True)
-    hourly_df = helper.hourly_activity(selected_user, df)
     fig = go.Figure([go.Bar(x=hourly_df.index, y=hourly_df.values, marker_color='#1ABC9C')])
     fig.update_layout(
         xaxis_title='Hour',
@@ -481,9 +650,8 @@ def display_hourly_activity(selected_user, df):
     st.plotly_chart(fig, use_container_width=True)
 
 # —————————— DAY-OF-MONTH & LENGTH DISTRIBUTION ——————————
-def plot_day_of_month_activity(selected_user, df):
+def plot_day_of_month_activity(df_day):
     st.markdown('<div class="title">📅 Day of Month Activity</div>', unsafe_allow_html=True)
-    df_day = helper.day_of_month_activity(selected_user, df)
     fig = go.Figure([go.Bar(x=df_day.index, y=df_day.values, marker_color='#8E44AD')])
     fig.update_layout(
         xaxis_title='Day of Month',
@@ -492,14 +660,15 @@ def plot_day_of_month_activity(selected_user, df):
     )
     st.plotly_chart(fig, use_container_width=True)
 
-def display_message_length_dist(selected_user, df):
+def display_message_length_dist(msg_len_bins):
     st.markdown('<div class="title">✍️ Message Length Distribution</div>', unsafe_allow_html=True)
-    msg_len_df = helper.message_length_distribution(selected_user, df)
-    fig = px.histogram(
-        msg_len_df, 
-        nbins=30, 
-        title="Message Lengths (Number of Characters)"
-    )
+    # Bins are computed server-side; the chart only gets one bar per bin
+    fig = go.Figure([go.Bar(
+        x=(msg_len_bins['start'] + msg_len_bins['end']) / 2,
+        y=msg_len_bins['count'],
+        width=msg_len_bins['end'] - msg_len_bins['start'],
+    )])
+    fig.update_layout(title="Message Lengths (Number of Characters)", bargap=0)
     fig.update_layout(
         margin=dict(t=30, b=20, l=20, r=20),
         xaxis_title="Length",
@@ -508,17 +677,16 @@ def display_message_length_dist(selected_user, df):
     st.plotly_chart(fig, use_container_width=True)
 
 # —————————— LEXICAL RICHNESS & SENTIMENT ——————————
-def display_lexical_richness(selected_user, df):
-    richness = helper.lexical_richness(selected_user, df)
+def display_lexical_richness(richness):
     st.markdown('<div class="metric-card" style="margin-top:1rem;">', unsafe_allow_html=True)
     st.subheader("🧠 Lexical Richness")
     st.markdown(f"### {richness:.2f}")
     st.markdown('</div>', unsafe_allow_html=True)
 
 
-def display_sentiment_analysis(selected_user, df):
+def display_sentiment_analysis(sentiment_result):
     st.markdown('<div class="title">💬 Sentiment Analysis</div>', unsafe_allow_html=True)
-    sentiment_counts, sentiment_df = helper.sentiment_analysis(selected_user, df)
+    sentiment_counts, sentiment_df = sentiment_result
 
     # Pie chart section
     pie_fig = px.pie(
@@ -535,10 +703,106 @@ def display_sentiment_analysis(selected_user, df):
 
     # DataFrame section
     st.markdown("**Detailed Sentiment Data**")
-    st.dataframe(sentiment_df.style.highlight_max(axis=0, color="#A3E4D7"),use_container_width=True)
+    display_sentiment_table(sentiment_df)
+
+
+def reset_sentiment_page():
+    st.session_state["sentiment_page"] = 1
+
+def display_sentiment_table(sentiment_df, page_size=50):
+    # Filtering, sorting and paging happen here; only the visible page is
+    # styled and sent to the browser
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        sentiments = st.multiselect(
+            "Sentiment", ["Positive", "Neutral", "Negative"],
+            key="sentiment_filter", on_change=reset_sentiment_page
+        )
+    with col2:
+        users = st.multiselect(
+            "User", sorted(map(str, pd.unique(sentiment_df["user"]))),
+            key="sentiment_users", on_change=reset_sentiment_page
+        )
+    with col3:
+        orders = {"Chat order": None, "Most positive first": "desc", "Most negative first": "asc"}
+        order = st.selectbox("Sort", list(orders), key="sentiment_order", on_change=reset_sentiment_page)
+
+    positions = helper.sentiment_rows(sentiment_df, sentiments, users, orders[order])
+    n_pages = max(1, -(-len(positions) // page_size))
+    if st.session_state.get("sentiment_page", 1) > n_pages:
+        reset_sentiment_page()
+    page = st.number_input(f"Page (of {n_pages})", min_value=1, max_value=n_pages, key="sentiment_page")
+
+    rows = sentiment_df.iloc[positions[(page - 1) * page_size:page * page_size]]
+    st.dataframe(rows.astype({"user": str}).style.highlight_max(axis=0, color="#A3E4D7"), use_container_width=True)
+    st.caption(f"{len(positions)} of {len(sentiment_df)} messages")
+
+    # Files are only built when a download button is clicked
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button(
+            "📥 Download CSV", lambda: helper.sentiment_export(sentiment_df, positions, "csv"),
+            file_name="sentiment.csv", mime="text/csv", on_click="ignore"
+        )
+    if parse_cache.pyarrow is not None:
+        with col2:
+            st.download_button(
+                "📥 Download Parquet", lambda: helper.sentiment_export(sentiment_df, positions, "parquet"),
+                file_name="sentiment.parquet", mime="application/octet-stream", on_click="ignore"
+            )
 
 
 # —————————— MAIN ——————————
+# —————————— CONVERSATIONS ——————————
+def display_conversations(selected_user, data, top_users=10):
+    st.markdown('<div class="title">🗨️ Conversations</div>', unsafe_allow_html=True)
+    sessions = data["sessions"]
+    caption = f"A session ends after {session_gap_minutes} minutes without messages."
+    if selected_user != 'Overall':
+        caption += f" Session figures are for the sessions {selected_user} started."
+    st.caption(caption)
+
+    cards = [
+        ("Sessions", sessions["sessions"]),
+        ("Median Length (min)", round(sessions["median_minutes"], 1)),
+        ("Messages / Session", round(sessions["avg_messages"], 1)),
+        ("Sessions / Week", round(sessions["per_week"], 2)),
+    ]
+    for col, (label, value) in zip(st.columns(4), cards):
+        with col:
+            st.markdown('<div class="metric-card">', unsafe_allow_html=True)
+            st.subheader(label)
+            st.markdown(f"#### {value}")
+            st.markdown('</div>', unsafe_allow_html=True)
+
+    latency = data["latency"]
+    if latency.empty:
+        st.info("No replies found in this chat.")
+        return
+
+    st.subheader("Reply Latency")
+    styled = latency.style.background_gradient(cmap="Greens", subset=["replies"])
+    if selected_user != 'Overall':
+        styled = styled.apply(
+            lambda row: ["font-weight: bold" if row["user"] == selected_user else ""] * len(row), axis=1
+        )
+    st.dataframe(styled, use_container_width=True)
+
+    # Reply counts between the most replying users; the full matrix stays sparse
+    st.subheader("Who Replies to Whom")
+    users = latency["user"].head(top_users).tolist()
+    pairs = data["replies"]
+    pairs = pairs[pairs["from"].isin(users) & pairs["to"].isin(users)]
+    matrix = pairs.pivot(index="from", columns="to", values="replies").reindex(index=users, columns=users).fillna(0)
+    fig = px.imshow(
+        matrix,
+        color_continuous_scale="Greens",
+        labels=dict(x="Replied to", y="Reply from", color="Replies"),
+    )
+    fig.update_layout(margin=dict(t=30, b=20, l=20, r=20))
+    st.plotly_chart(fig, use_container_width=True)
+
+
 def main():
     st.markdown(
         """
@@ -707,8 +971,8 @@ def main():
 
     custom_css = """
     <style>
-    /* Change font size and font family of tab labels */
-    .stTabs button[role="tab"] {
+    /* Change font size and font family of section labels */
+    button[data-testid^="stBaseButton-segmented_control"] {
         font-size: 18px !important;
         font-weight: bold;
         font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
@@ -721,21 +985,21 @@ def main():
         transition: background-color 0.3s, color 0.3s;
     }
 
-    /* Change active tab color */
-    .stTabs button[role="tab"][aria-selected="true"] {
+    /* Change active section color */
+    button[data-testid="stBaseButton-segmented_controlActive"] {
         color: white;
         background-color: #25D366; /* WhatsApp bright green */
 
     }
 
-    /* Hover effect on tabs */
-    .stTabs button[role="tab"]:hover:not([aria-selected="true"]) {
+    /* Hover effect on sections */
+    button[data-testid="stBaseButton-segmented_control"]:hover {
         background-color: #D6E8E0;
         cursor: pointer;
     }
 
-    /* Increase font size for all markdown texts inside tabs */
-    .stTabs div[data-testid="stMarkdownContainer"] {
+    /* Increase font size for all markdown texts in the sections */
+    .st-key-section_body div[data-testid="stMarkdownContainer"] {
         font-size: 16px !important;
         font-family: 'Arial', sans-serif;
         color: #202C33; /* WhatsApp dark text */
@@ -753,58 +1017,79 @@ def main():
     # Only show analysis if button clicked
     if show_analysis:
         st.markdown(custom_css, unsafe_allow_html=True)        
-        display_stats(selected_user, df)
+        display_stats(section_data(df.key, selected_user, "Stats", df)["stats"])
 
-        tab1, tab2, tab3 = st.tabs(["Timeline & Activity", "Text Overview", "Extra Insights"])
+        # Only the selected section is computed and rendered on each rerun
+        section = st.segmented_control(
+            "Section", sections, default=sections[0], key="section", label_visibility="collapsed"
+        ) or sections[0]
+        data = section_data(df.key, selected_user, section, df)
 
-        with tab1:
+        with st.container(key="section_body"):
             st.markdown('<div class="separator"></div>', unsafe_allow_html=True)
-            plot_timeline(
-                "Monthly Timeline",
-                helper.monthly_timeline(selected_user, df),
-                x_col='time', y_col='message',
-                marker_color='#E74C3C'
-            )
-            plot_timeline(
-                "Daily Timeline",
-                helper.daily_timeline(selected_user, df),
-                x_col='date', y_col='message',
-                marker_color='#27AE60'
-            )
+            if section == "Timeline & Activity":
+                plot_timeline(
+                    "Monthly Timeline",
+                    data["monthly"],
+                    x_col='time', y_col='message',
+                    marker_color='#E74C3C'
+                )
+                daily, daily_label = data["daily"]
+                plot_timeline(
+                    f"{daily_label} Timeline",
+                    daily,
+                    x_col='date', y_col='message',
+                    marker_color='#27AE60'
+                )
 
-            plot_activity_map(selected_user, df)
-            plot_weekly_activity_heatmap(selected_user, df)           
-            
-            # Additional info for 'Overall' selection
-            if selected_user == 'Overall':
-                st.markdown('<div class="separator"></div>', unsafe_allow_html=True)
-                display_busy_users(df)
+                plot_activity_map(data["busy_day"], data["busy_month"])
+                plot_weekly_activity_heatmap(data["heatmap"])
 
-            # Optionally show message or skip logic for group notifications
-            elif selected_user == 'group_notification':
-                st.info("Group notifications are excluded from user-specific analysis.")
+                # Additional info for 'Overall' selection
+                if selected_user == 'Overall':
+                    st.markdown('<div class="separator"></div>', unsafe_allow_html=True)
+                    display_busy_users(data["busy_users"])
 
-        with tab2:
-            st.markdown('<div class="separator"></div>', unsafe_allow_html=True)
-            display_wordcloud(selected_user, df)
-            display_common_words(selected_user, df)
-            display_emoji_analysis(selected_user, df)
+                # Optionally show message or skip logic for group notifications
+                elif selected_user == 'group_notification':
+                    st.info("Group notifications are excluded from user-specific analysis.")
 
-        with tab3:
-            st.markdown('<div class="separator"></div>', unsafe_allow_html=True)
-            display_avg_messages(selected_user, df)
-            display_hourly_activity(selected_user, df)
-            plot_day_of_month_activity(selected_user, df)
-            display_message_length_dist(selected_user, df)
-            display_lexical_richness(selected_user, df)
-            display_sentiment_analysis(selected_user, df)
+            elif section == "Text Overview":
+                display_wordcloud(selected_user, data["wordcloud"])
+                display_common_words(selected_user, data["common_words"])
+                display_emoji_analysis(data["emojis"])
+                display_top_domains(data["domains"])
+
+            elif section == "Conversations":
+                display_conversations(selected_user, data)
+
+            else:
+                display_avg_messages(data["avg_per_day"])
+                display_hourly_activity(data["hourly"])
+                plot_day_of_month_activity(data["day_of_month"])
+                display_message_length_dist(data["message_lengths"])
+                display_lexical_richness(data["richness"])
+                display_sentiment_analysis(data["sentiment"])
 
     else:
         st.info("Upload a chat file and click 'Show Analysis' to view insights.")
 
 
 
+def display_performance(records):
+    # Hidden panel: open the app with ?perf=1 to see where this rerun went
+    with st.expander("⏱️ Performance"):
+        summary = profiling.summary(records)
+        summary["stage"] = ["\u00a0\u00a0" * depth + stage for depth, stage in zip(summary.pop("depth"), summary["stage"])]
+        total = sum(r["seconds"] for r in records if r["depth"] == 0)
+        st.caption(f"{total:.3f}s in {len(records)} instrumented calls · RSS {profiling.rss_mb():.0f} MB")
+        st.dataframe(summary, hide_index=True, use_container_width=True)
+
+
 if __name__ == "__main__":
-    main()
+    with profiling.collect() as records:
+        main()
     add_footer()
+    if "perf" in st.query_params:
+        display_performance(records)
 
@@ -0,0 +1,20 @@
+import importlib
+import os
+
+# Analysis engines exposing helper.py's functions with the same arguments and
+# return values. pandas (helper.py) is the default and the reference; pick
+# another with get_backend('polars') or CHAT_BACKEND=polars.
+backends = {
+    'pandas': 'helper',
+    'polars': 'polars_helper',
+}
+
+
+def get_backend(name=None):
+    name = name or os.environ.get('CHAT_BACKEND') or 'pandas'
+    if name not in backends:
+        raise ValueError(f"unknown backend {name!r} (expected one of: {', '.join(backends)})")
+    module = importlib.import_module(backends[name])
+    if getattr(module, 'pl', True) is None:
+        raise ImportError(f"the {name} backend needs the {name} package (pip install {name})")
+    return module
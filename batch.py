@@ -0,0 +1,133 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+import pandas as pd
+import backends, exports, preprocessor
+from chat_index import ChatIndex
+
+# Headless analysis of a directory of exports:
+#   python batch.py exports/ results/ --workers 8 --format parquet
+# Each chat gets <file name>.json (or a <file name>.parquet/ directory of
+# Parquet tables) in the output directory, so Family.txt and Family.zip don't
+# collide, nor do outputs with their inputs when both directories are one. Finished outputs are skipped on the next run, and failures are
+# appended to errors.log as JSON lines.
+
+
+def analyze(df, backend='pandas'):
+    helper = backends.get_backend(backend)
+    chat = ChatIndex(df)
+    num_messages, words, media, links = helper.fetch_stats(chat, 'Overall')
+    sentiment_counts, _ = helper.sentiment_analysis('Overall', chat, workers=1)
+    emojis = helper.emoji_helper('Overall', chat)
+    top_users, user_percent = helper.most_busy_users(chat)
+    sessions = helper.session_stats('Overall', chat)
+
+    return {
+        'stats': pd.DataFrame([{
+            'messages': num_messages,
+            'words': words,
+            'media': media,
+            'links': links,
+            'users': len([u for u in chat.users if u != 'group_notification']),
+            'avg_messages_per_day': helper.average_messages_per_day('Overall', chat),
+            'lexical_richness': helper.lexical_richness('Overall', chat),
+            'sessions': sessions['sessions'],
+            'median_session_minutes': sessions['median_minutes'],
+        }]),
+        'monthly_timeline': helper.monthly_timeline('Overall', chat),
+        'daily_timeline': helper.daily_timeline('Overall', chat),
+        'hourly_activity': helper.hourly_activity('Overall', chat).reset_index(),
+        'week_activity': helper.week_activity_map('Overall', chat).reset_index(),
+        'users': user_percent,
+        'reply_latency': helper.reply_latency(chat),
+        'reply_pairs': helper.reply_pairs(chat),
+        'top_words': helper.most_common_words('Overall', chat).set_axis(['word', 'count'], axis=1)
+        if len(chat) else pd.DataFrame(columns=['word', 'count']),
+        'emojis': emojis.set_axis(['emoji', 'count'], axis=1)
+        if isinstance(emojis, pd.DataFrame) else pd.DataFrame(columns=['emoji', 'count']),
+        'sentiment': sentiment_counts.rename_axis('sentiment').reset_index(),
+    }
+
+
+def write_json(results, path):
+    payload = {name: json.loads(table.to_json(orient='records', date_format='iso')) for name, table in results.items()}
+    payload['stats'] = payload['stats'][0]
+    tmp_path = path.with_name(path.name + '.tmp')
+    tmp_path.write_text(json.dumps(payload, ensure_ascii=False), encoding='utf-8')
+    os.replace(tmp_path, path)
+
+
+def write_parquet(results, path):
+    tmp_path = path.with_name(path.name + '.tmp')
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    tmp_path.mkdir()
+    for name, table in results.items():
+        table.to_parquet(tmp_path / f'{name}.parquet', index=False)
+    os.replace(tmp_path, path)
+
+
+def output_path(source, out_dir, fmt):
+    return out_dir / f'{source.name}.{fmt}'
+
+
+def process(source, out_dir, fmt, backend='pandas'):
+    start = time.perf_counter()
+    try:
+        with exports.open_chat(source) as f:
+            df = preprocessor.preprocess_stream(f, compact=True)
+        if df.empty:
+            raise ValueError("no messages found; is this a WhatsApp chat export?")
+        results = analyze(df, backend)
+        target = output_path(source, out_dir, fmt)
+        (write_json if fmt == 'json' else write_parquet)(results, target)
+        return source, len(df), time.perf_counter() - start, None
+    except Exception:
+        return source, 0, time.perf_counter() - start, traceback.format_exc()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze a directory of WhatsApp chat exports.")
+    parser.add_argument('input_dir', type=Path)
+    parser.add_argument('output_dir', type=Path)
+    parser.add_argument('--pattern', help="glob for export files (default: *.txt and *.zip)")
+    parser.add_argument('--format', choices=['json', 'parquet'], default='json')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--backend', choices=list(backends.backends), default='pandas',
+                        help="analysis engine (default: pandas)")
+    parser.add_argument('--force', action='store_true', help="re-analyze files that already have output")
+    args = parser.parse_args(argv)
+
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    if args.pattern:
+        sources = sorted(args.input_dir.glob(args.pattern))
+    else:
+        sources = sorted(p for p in args.input_dir.iterdir() if p.suffix.lower() in exports.chat_suffixes)
+    todo = [s for s in sources if args.force or not output_path(s, args.output_dir, args.format).exists()]
+    skipped = len(sources) - len(todo)
+    print(f"{len(sources)} exports, {skipped} already done, {len(todo)} to analyze", file=sys.stderr)
+
+    failures = 0
+    with ProcessPoolExecutor(max_workers=max(args.workers, 1)) as pool, \
+            open(args.output_dir / 'errors.log', 'a', encoding='utf-8') as error_log:
+        futures = [pool.submit(process, s, args.output_dir, args.format, args.backend) for s in todo]
+        for done, future in enumerate(as_completed(futures), 1):
+            source, rows, seconds, error = future.result()
+            status = f"{rows} messages in {seconds:.1f}s" if error is None else "FAILED"
+            print(f"[{done}/{len(todo)}] {source.name}: {status}", file=sys.stderr)
+            if error is not None:
+                failures += 1
+                error_log.write(json.dumps({'file': str(source), 'time': time.time(), 'error': error}) + '\n')
+                error_log.flush()
+
+    print(f"done: {len(todo) - failures} analyzed, {failures} failed", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,289 @@
+import argparse
+import copy
+import inspect
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+import numpy as np
+
+# Benchmark harness:
+#   python benchmark.py                      # 10k, 1m and 10m messages
+#   python benchmark.py --sizes 10k,1m --save-baseline
+#   python benchmark.py --sizes 1m --stream  # time the app's parse path
+# Synthetic exports are generated once per size/seed under .bench/. Each size
+# is measured in its own subprocess so peak RSS is not shared between runs,
+# and every step is compared against benchmark_baseline.json when it exists.
+# On Linux the peak is reset before each step, so it is that step's own peak.
+# The chat's shared aggregates are timed as separate steps, and every helper
+# runs with cold sentiment, wordcloud and URL caches.
+
+bench_dir = Path('.bench')
+baseline_path = Path('benchmark_baseline.json')
+
+emoji_pool = ['😂', '❤️', '😊', '👍', '🙏', '😭', '🔥', '🎉', '👍🏽', '👨‍💻', '👩‍👩‍👧', '🇮🇳', '1️⃣', '☀️']
+domain_pool = ['youtube.com', 'instagram.com', 'github.com', 'maps.google.com', 'en.wikipedia.org',
+               'news.ycombinator.com', 'example.org', 'docs.python.org']
+
+
+def _vocabulary(rng, size=5_000):
+    # Pronounceable pseudo-words; drawn with a Zipf law so a few are very common
+    consonants = list('bcdfghjklmnprstvwyz')
+    vowels = list('aeiou')
+    words = set()
+    while len(words) < size:
+        n = rng.integers(1, 4)
+        words.add(''.join(rng.choice(consonants) + rng.choice(vowels) for _ in range(n)))
+    return np.array(sorted(words), dtype=object)
+
+
+def generate_chat(n_messages, n_users=12, years=3, emoji_rate=0.15, url_rate=0.03, media_rate=0.05,
+                  notification_rate=0.01, multiline_rate=0.01, seed=0, chunk_size=100_000):
+    # Deterministic Android-style export (12-hour clock, dd/mm/yy) as lines.
+    # Timestamps are spread over `years` years and users post with Zipf-like
+    # activity, so per-user slices range from large to tiny.
+    rng = np.random.default_rng(seed)
+    vocab = _vocabulary(rng)
+    word_p = 1 / np.arange(1, len(vocab) + 1)
+    word_p /= word_p.sum()
+    users = np.array([f'User {i}' if i % 4 else f'+91 98{i:03d} {i * 7919 % 100_000:05d}' for i in range(n_users)],
+                     dtype=object)
+    user_p = 1 / np.arange(1, n_users + 1)
+    user_p /= user_p.sum()
+
+    start = np.datetime64('2019-01-01T00:00')
+    span = int(years * 365.25 * 24 * 60)
+    minutes = np.sort(rng.integers(0, span, n_messages))
+    days = (start + np.arange(span // 1440 + 1) * np.timedelta64(1, 'D')).astype('datetime64[D]')
+    day_labels = [d.strftime('%d/%m/%y') for d in days.tolist()]
+    clock_labels = [f"{(m // 60) % 12 or 12}:{m % 60:02d} {'am' if m < 720 else 'pm'}" for m in range(1440)]
+
+    for lo in range(0, n_messages, chunk_size):
+        hi = min(lo + chunk_size, n_messages)
+        n = hi - lo
+        block = minutes[lo:hi]
+        senders = users[rng.choice(n_users, n, p=user_p)]
+        kind = rng.random(n)
+        n_words = rng.integers(1, 16, n)
+        word_ids = rng.choice(len(vocab), int(n_words.sum()), p=word_p)
+        ends = np.cumsum(n_words)
+        extras = rng.random((n, 3))
+        emoji_ids = rng.integers(0, len(emoji_pool), n)
+        domain_ids = rng.integers(0, len(domain_pool), n)
+
+        for i in range(n):
+            ts = f'{day_labels[block[i] // 1440]}, {clock_labels[block[i] % 1440]}'
+            if kind[i] < notification_rate:
+                yield f'{ts} - {senders[i]} added {senders[i - 1]}\n'
+                continue
+            if kind[i] < notification_rate + media_rate:
+                yield f'{ts} - {senders[i]}: <Media omitted>\n'
+                continue
+            text = ' '.join(vocab[word_ids[ends[i] - n_words[i]:ends[i]]])
+            if extras[i, 0] < emoji_rate:
+                text += ' ' + emoji_pool[emoji_ids[i]]
+            if extras[i, 1] < url_rate:
+                text += f' https://{domain_pool[domain_ids[i]]}/p/{lo + i}'
+            yield f'{ts} - {senders[i]}: {text}\n'
+            if extras[i, 2] < multiline_rate:
+                yield f'{text}\n'
+
+
+def parse_size(text):
+    text = text.strip().lower()
+    scale = {'k': 1_000, 'm': 1_000_000}.get(text[-1], 1)
+    return int(float(text[:-1] if scale > 1 else text) * scale)
+
+
+def chat_file(n_messages, seed):
+    path = bench_dir / f'chat_{n_messages}_{seed}.txt'
+    if not path.exists():
+        bench_dir.mkdir(exist_ok=True)
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.writelines(generate_chat(n_messages, seed=seed))
+        os.replace(tmp_path, path)
+    return path
+
+
+def reset_peak_rss():
+    # Linux lets a process reset its peak RSS (VmHWM), so each step gets a
+    # peak of its own; elsewhere ru_maxrss only ever grows over the run
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def public_helpers(backend='pandas'):
+    import backends
+    helper = backends.get_backend(backend)
+    for name, func in inspect.getmembers(helper, inspect.isfunction):
+        if name.startswith('_') or func.__module__ != helper.__name__:
+            continue
+        params = inspect.signature(func).parameters
+        required = [p for p in params.values() if p.default is inspect.Parameter.empty]
+        if all(p.name in ('selected_user', 'user', 'df') for p in required):
+            yield name, func, [p.name for p in required]
+
+
+def run_steps(path, stream=False, skip=(), backend='pandas'):
+    # Runs in the child process: one record per step, with the wall time of
+    # the step and the peak RSS while it ran (where the peak can be reset)
+    import backends
+    import helper
+    import preprocessor
+    import sentiment
+    import urls
+    from chat_index import ChatIndex
+    results = {}
+    per_step_peak = reset_peak_rss()
+
+    def timed(step, func, *args):
+        reset_peak_rss()
+        start = time.perf_counter()
+        value = func(*args)
+        results[step] = {'seconds': round(time.perf_counter() - start, 4), 'peak_rss_mb': round(peak_rss_mb(), 1)}
+        return value
+
+    if stream:
+        def parse():
+            with open(path, encoding='utf-8') as f:
+                return preprocessor.preprocess_stream(f, compact=True)
+        df = timed('preprocess_stream', parse)
+    else:
+        df = timed('preprocessor', lambda: preprocessor.preprocessor(Path(path).read_text(encoding='utf-8')))
+    chat = timed('chat_index', ChatIndex, df, 'bench')
+
+    # Aggregates shared by several helpers are steps of their own, so their
+    # cost isn't billed to whichever helper happens to run first
+    timed('chat_index.tokens', lambda: chat.tokens)
+    timed('chat_index.tokens.cloud_terms', lambda: chat.tokens.cloud_terms)
+    timed('chat_index.tokens.unique_per_message', lambda: chat.tokens.unique_per_message)
+    timed('chat_index.time_cube', lambda: chat.time_cube.overall)
+    timed('chat_index.emoji_counts', lambda: chat.emoji_counts)
+    timed('chat_index.conversations', chat.conversations)
+    engine = backends.get_backend(backend)
+    if hasattr(engine, '_frame'):
+        timed(f'{backend}_frame', engine._frame, chat)
+
+    def fresh():
+        # The index with the aggregates above but without what earlier
+        # helpers left behind: sentiment scores, rendered wordclouds, URL
+        # lookups and the score store
+        view = copy.copy(chat)
+        view._compound = None
+        helper.wordcloud_images.clear()
+        urls.find_urls.cache_clear()
+        sentiment.default_store = sentiment.ScoreStore()
+        return view
+
+    counts = np.bincount(chat.codes, minlength=len(chat.users))
+    top_user = chat.users[int(counts.argmax())]
+    for name, func, params in public_helpers(backend):
+        if name in skip:
+            continue
+        for label, user in (('overall', 'Overall'), ('user', top_user)):
+            if params == ['df'] and label == 'user':
+                continue
+            args = {'selected_user': user, 'user': user, 'df': fresh()}
+            timed(f'{name}[{label}]', func, *(args[p] for p in params))
+    return {'rows': len(df), 'per_step_peak': per_step_peak, 'steps': results}
+
+
+def measure(n_messages, seed, stream, skip, backend='pandas'):
+    path = chat_file(n_messages, seed)
+    cmd = [sys.executable, __file__, '--child', str(path), '--skip', ','.join(skip), '--backend', backend]
+    if stream:
+        cmd.append('--stream')
+    out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+    return json.loads(out.splitlines()[-1])
+
+
+def compare(results, baseline, tolerance, min_seconds=0.05):
+    # A step regresses when it is both `tolerance` slower (or larger) in
+    # relative terms and above the noise floor in absolute terms
+    regressions = []
+    for size, run in results.items():
+        for step, now in run['steps'].items():
+            before = baseline.get(size, {}).get('steps', {}).get(step)
+            if before is None:
+                continue
+            if now['seconds'] > before['seconds'] * (1 + tolerance) and now['seconds'] - before['seconds'] > min_seconds:
+                regressions.append(f"{size} {step}: {before['seconds']:.3f}s -> {now['seconds']:.3f}s")
+            if now['peak_rss_mb'] > before['peak_rss_mb'] * (1 + tolerance):
+                regressions.append(f"{size} {step}: peak RSS {before['peak_rss_mb']:.0f} -> {now['peak_rss_mb']:.0f} MB")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the preprocessor and helpers on synthetic chats.")
+    parser.add_argument('--sizes', default='10k,1m,10m', help="comma-separated message counts (default: 10k,1m,10m)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--stream', action='store_true', help="parse with preprocess_stream(compact=True) like the app")
+    parser.add_argument('--backend', default='pandas', help="helper engine to time: pandas or polars (default: pandas)")
+    parser.add_argument('--skip', default='', help="comma-separated helper names to leave out")
+    parser.add_argument('--baseline', type=Path, default=baseline_path)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed relative slowdown (default: 0.25)")
+    parser.add_argument('--output', type=Path, help="also write the results to this JSON file")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    skip = [name for name in args.skip.split(',') if name]
+
+    if args.child:
+        print(json.dumps(run_steps(args.child, args.stream, skip, args.backend)))
+        return 0
+
+    results = {}
+    for size in args.sizes.split(','):
+        n_messages = parse_size(size)
+        print(f"{size}: generating/measuring {n_messages} messages...", file=sys.stderr)
+        run = measure(n_messages, args.seed, args.stream, skip, args.backend)
+        results[size] = run
+        for step, record in run['steps'].items():
+            print(f"  {step:<40} {record['seconds']:>9.3f}s {record['peak_rss_mb']:>9.1f} MB")
+
+    report = {'python': platform.python_version(), 'machine': platform.machine(), 'cpus': os.cpu_count(),
+              'stream': args.stream, 'backend': args.backend, 'results': results}
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+
+    status = 0
+    if args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text())
+        regressions = compare(results, baseline['results'], args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        print(f"{len(regressions)} regressions against {args.baseline}")
+        status = 1 if regressions else 0
+    if args.save_baseline:
+        # Sizes measured earlier and not rerun now keep their old numbers
+        if args.baseline.exists():
+            report['results'] = {**json.loads(args.baseline.read_text())['results'], **results}
+        args.baseline.write_text(json.dumps(report, indent=2))
+        print(f"baseline saved to {args.baseline}")
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
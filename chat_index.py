@@ -0,0 +1,172 @@
+from collections import Counter
+from functools import cached_property
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+import emojis
+import sentiment
+from conversation import Conversations
+from timecube import TimeCube
+from tokens import TokenStore
+
+
+class ChatIndex:
+    # Per-user row lookup built once per parsed chat. Rows are stably grouped
+    # by user, so each user's messages form one contiguous block (still in time
+    # order) and a user view is a slice of that block instead of a filtered copy.
+
+    def __init__(self, df, key=None):
+        self.df = df
+        self.key = key
+
+        codes, users = pd.factorize(df['user'], sort=False)
+        self.codes = codes.astype(np.int32)
+        self.users = list(users)
+        self._user_codes = {user: code for code, user in enumerate(self.users)}
+
+        self.order = np.argsort(self.codes, kind='stable')
+        self.counts = np.bincount(self.codes, minlength=len(self.users))
+        self.bounds = np.concatenate([[0], np.cumsum(self.counts)])
+        self._compound = None
+        self._conversations = {}
+
+    def __len__(self):
+        return len(self.df)
+
+    def append(self, rows, key=None):
+        # Index of this chat with newer parsed rows after it. User codes of
+        # existing users are unchanged (first appearance order), so per-chat
+        # aggregates built so far are extended with the new rows only.
+        df = pd.concat([self.df, rows], ignore_index=True)
+        if isinstance(self.df['user'].dtype, pd.CategoricalDtype):
+            df['user'] = union_categoricals([self.df['user'], rows['user'].astype('category')])
+        chat = ChatIndex(df, key)
+        new = slice(len(self.df), None)
+        cached = self.__dict__
+        if 'tokens' in cached:
+            chat.tokens = self.tokens.extended(rows['message'], rows['n_words'])
+        if 'emoji_counts' in cached:
+            has_emojis = np.flatnonzero(rows['n_emojis'].to_numpy() > 0)
+            by_code = emojis.emoji_counts(rows['message'].iloc[has_emojis], chat.codes[new][has_emojis])
+            counts = {user: counter.copy() for user, counter in self.emoji_counts.items()}
+            for code, counter in by_code.items():
+                counts.setdefault(chat.users[code], Counter()).update(counter)
+                counts['Overall'].update(counter)
+            chat.emoji_counts = counts
+        if 'time_cube' in cached:
+            chat.time_cube = self.time_cube.extended(rows['date_time'], chat.codes[new], len(chat.users))
+        if self._compound is not None:
+            chat._compound = np.concatenate([self._compound, np.full(len(rows), np.nan)])
+        return chat
+
+    @cached_property
+    def tokens(self):
+        return TokenStore(self.df['message'], self.df['n_words'])
+
+    @cached_property
+    def emoji_counts(self):
+        # Emoji Counter per user (and 'Overall') from one scan of the
+        # messages that contain emojis
+        has_emojis = np.flatnonzero(self.df['n_emojis'].to_numpy() > 0)
+        by_code = emojis.emoji_counts(self.df['message'].iloc[has_emojis], self.codes[has_emojis])
+        counts = {self.users[code]: counter for code, counter in by_code.items()}
+        counts['Overall'] = sum(by_code.values(), Counter())
+        return counts
+
+    def sentiment_scores(self, user, workers=None, store=None):
+        # Compound score of each of the user's messages (in positions order);
+        # rows already scored for an earlier selection are not looked up again
+        if self._compound is None:
+            self._compound = np.full(len(self.df), np.nan)
+        positions = self.positions(user)
+        todo = positions[np.isnan(self._compound[positions])]
+        if len(todo):
+            store = store or sentiment.default_store
+            self._compound[todo] = store.scores(self.df['message'].iloc[todo], workers=workers)
+        return self._compound[positions]
+
+    @cached_property
+    def time_cube(self):
+        return TimeCube(self.df['date_time'], self.codes, len(self.users))
+
+    @cached_property
+    def time_order(self):
+        # Row order that sorts date_time, or None when the rows already are
+        # (late-delivered messages can carry an earlier timestamp)
+        times = self.df['date_time']
+        return None if times.is_monotonic_increasing else np.argsort(times.to_numpy(), kind='stable')
+
+    def window(self, start, end, key=None):
+        # Index of the messages with start <= date_time < end, found with two
+        # binary searches on the sorted times. For a chat in time order the
+        # window is one contiguous slice, which reuses this chat's tokens and
+        # sentiment scores; the time cube is reused when no day is split.
+        times = self.df['date_time'].to_numpy()
+        order = self.time_order
+        if order is not None:
+            times = times[order]
+        lo, hi = np.searchsorted(times, np.array([start, end], dtype='datetime64[ns]'))
+        if lo == 0 and hi == len(times):
+            return self
+
+        if order is None:
+            rows = slice(lo, hi)
+        else:
+            # The window's rows in chat order; still a slice if they are adjacent
+            rows = np.sort(order[lo:hi])
+            if len(rows) and rows[-1] - rows[0] + 1 == len(rows):
+                rows = slice(int(rows[0]), int(rows[-1]) + 1)
+        chat = ChatIndex(self.df.iloc[rows], key or f'{self.key}[{lo}:{hi}]')
+        if lo == hi:
+            return chat
+        cached = self.__dict__
+        if 'tokens' in cached and isinstance(rows, slice):
+            chat.tokens = self.tokens.window(rows.start, rows.stop)
+        if 'time_cube' in cached:
+            days = times[[max(lo - 1, 0), lo, hi - 1, min(hi, len(times) - 1)]].astype('datetime64[D]')
+            if (lo == 0 or days[0] < days[1]) and (hi == len(times) or days[2] < days[3]):
+                first = int((days[1] - self.time_cube.first_day).astype(np.int64))
+                last = int((days[2] - self.time_cube.first_day).astype(np.int64))
+                codes = [self.user_code(user) for user in chat.users]
+                chat.time_cube = self.time_cube.window(first, last + 1, codes)
+        if self._compound is None:
+            self._compound = np.full(len(self.df), np.nan)
+        # A slice is a view, so scores computed for the window fill this
+        # chat's too; scattered rows get a copy
+        chat._compound = self._compound[rows]
+        return chat
+
+    def conversations(self, gap_minutes=30):
+        # Sessions and replies for one idle gap, computed once per gap
+        if gap_minutes not in self._conversations:
+            self._conversations[gap_minutes] = Conversations(
+                self.df['date_time'], self.codes, len(self.users), gap_minutes,
+                skip_code=self.user_code('group_notification'),
+            )
+        return self._conversations[gap_minutes]
+
+    def time_grid(self, user):
+        # Day x hour message counts of one user (or 'Overall')
+        if user == 'Overall':
+            return self.time_cube.overall
+        code = self.user_code(user)
+        return self.time_cube.empty_grid() if code is None else self.time_cube.grid(code)
+
+    def user_code(self, user):
+        return self._user_codes.get(user)
+
+    def positions(self, user):
+        # Row positions of a user's messages in self.df, in time order
+        if user == 'Overall':
+            return np.arange(len(self.df))
+        code = self.user_code(user)
+        if code is None:
+            return self.order[:0]
+        return self.order[self.bounds[code]:self.bounds[code + 1]]
+
+    def rows(self, user):
+        if user == 'Overall':
+            return self.df
+        # A copy of just this user's rows; helpers that only need a few
+        # columns read them at positions() instead
+        return self.df.iloc[self.positions(user)]
@@ -0,0 +1,73 @@
+from collections import OrderedDict
+import numpy as np
+import exports
+import preprocessor
+from chat_index import ChatIndex
+from parse_cache import ParseCache, content_hash
+
+
+class ChatStore:
+    # Parsed chats by identity (exports.chat_identity, scoped by the caller),
+    # so a newer export of a stored chat only has the messages after the
+    # stored ones parsed and indexed. An export is merged only when it
+    # repeats the stored chat's last messages; any other export is analyzed
+    # on its own, and becomes the stored copy if it reaches past the stored
+    # last message. Frames persist through the ParseCache; indexes and their
+    # aggregates stay in memory.
+
+    def __init__(self, cache=None, max_entries=8):
+        self.cache = cache or ParseCache()
+        self.max_entries = max_entries
+        self._chats = OrderedDict()
+
+    def _key(self, identity):
+        return 'chat-' + content_hash(identity.encode())
+
+    def get(self, identity):
+        if identity in self._chats:
+            self._chats.move_to_end(identity)
+            return self._chats[identity]
+        df = self.cache.get(self._key(identity))
+        if df is None:
+            return None
+        # A stored chat only grows at its end, so its length and last
+        # timestamp tell its versions apart
+        tail = df['date_time'].iloc[-1] if len(df) else None
+        chat = ChatIndex(df, key=content_hash(f'{identity}:{len(df)}:{tail}'.encode()))
+        self._remember(identity, chat)
+        return chat
+
+    def _remember(self, identity, chat):
+        self._chats[identity] = chat
+        self._chats.move_to_end(identity)
+        while len(self._chats) > self.max_entries:
+            self._chats.popitem(last=False)
+
+    def ingest(self, identity, source, key=None, compact=True, batch_size=100_000):
+        # Merges the export `source` (path or file object, .txt or .zip) into
+        # the stored chat; returns the chat and the number of rows parsed
+        stored = chat = self.get(identity)
+        if chat is not None and len(chat):
+            df = chat.df
+            times = df['date_time'].to_numpy()
+            at_last = np.flatnonzero(times == times[-1])
+            boundary = list(zip(df['user'].iloc[at_last].astype(str), df['message'].iloc[at_last]))
+            with exports.open_chat(source) as text:
+                rows = preprocessor.preprocess_after(text, times[-1], boundary, batch_size,
+                                                     compact='time' not in df.columns)
+            if rows is not None:
+                if len(rows):
+                    chat = chat.append(rows, key=content_hash(f'{chat.key}:{key}'.encode()))
+                    self.cache.put(self._key(identity), chat.df)
+                self._remember(identity, chat)
+                return chat, len(rows)
+
+        with exports.open_chat(source) as text:
+            df = preprocessor.preprocess_stream(text, batch_size, compact)
+        chat = ChatIndex(df, key=key)
+        if stored is None or not len(stored) or (
+                len(df) and df['date_time'].max() > stored.df['date_time'].max()):
+            # An older export (or a part) of the chat never replaces its history
+            self.cache.put(self._key(identity), df)
+            self._remember(identity, chat)
+        return chat, len(df)
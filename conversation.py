@@ -0,0 +1,63 @@
+import numpy as np
+
+
+class Conversations:
+    # Conversational structure of a chat from its time-ordered rows, with
+    # group notifications left out. A session is a run of messages with no
+    # silence longer than gap_minutes; within a session, a message replies to
+    # the previous one when its sender differs. Everything is a vectorized
+    # diff over neighbouring rows, so it is linear in the number of messages.
+
+    def __init__(self, date_time, codes, n_users, gap_minutes=30, skip_code=None):
+        times = np.asarray(date_time).astype('datetime64[ns]').view(np.int64)
+        codes = np.asarray(codes)
+        rows = np.arange(len(times)) if skip_code is None else np.flatnonzero(codes != skip_code)
+        if np.any(np.diff(times[rows]) < 0):
+            rows = rows[np.argsort(times[rows], kind='stable')]
+        times, codes = times[rows], codes[rows]
+        self.n_users = n_users
+        self.gap_minutes = gap_minutes
+
+        # Session starts: the first message and every message after a gap
+        gaps = np.diff(times)
+        new_session = np.ones(len(times), dtype=bool)
+        new_session[1:] = gaps > gap_minutes * 60 * 10 ** 9
+        starts = np.flatnonzero(new_session)
+        ends = np.append(starts[1:], len(times)) if len(times) else starts
+        self.session_start = times[starts].astype('datetime64[ns]')
+        self.session_end = times[ends - 1].astype('datetime64[ns]')
+        self.session_messages = ends - starts
+        self.session_initiator = codes[starts]
+
+        # Replies: same session, different sender than the message before
+        reply = ~new_session[1:] & (codes[1:] != codes[:-1])
+        self.reply_from = codes[1:][reply]
+        self.reply_to = codes[:-1][reply]
+        self.reply_latency = gaps[reply] / 1e9
+
+    def __len__(self):
+        return len(self.session_start)
+
+    def median_latency(self):
+        # (replies, median seconds to reply) per user code; NaN for users who
+        # never replied. Replies are grouped by code with a stable counting sort.
+        counts = np.bincount(self.reply_from, minlength=self.n_users)
+        order = np.argsort(self.reply_from.astype(np.int16 if self.n_users < 2 ** 15 else np.int32), kind='stable')
+        latency = self.reply_latency[order]
+        bounds = np.concatenate([[0], np.cumsum(counts)])
+        medians = np.full(self.n_users, np.nan)
+        for code in np.flatnonzero(counts):
+            medians[code] = np.median(latency[bounds[code]:bounds[code + 1]])
+        return counts, medians
+
+    def reply_matrix(self):
+        # Sparse who-replies-to-whom counts in COO form: (from codes, to
+        # codes, counts), one entry per pair that occurs
+        pairs = self.reply_from.astype(np.int64) * self.n_users + self.reply_to
+        if self.n_users ** 2 <= max(len(pairs), 1 << 20):
+            counts = np.bincount(pairs, minlength=self.n_users ** 2)
+            pairs = np.flatnonzero(counts)
+            counts = counts[pairs]
+        else:
+            pairs, counts = np.unique(pairs, return_counts=True)
+        return pairs // self.n_users, pairs % self.n_users, counts
@@ -0,0 +1,80 @@
+import re
+from collections import Counter
+import numpy as np
+import emoji
+
+
+def _build_trie(words):
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = word
+    return trie
+
+
+def _char_class(chars):
+    # Astral-plane code points become a few coarse ranges (the regex engine
+    # tests each range in turn, and the trie walk rejects false starts)
+    chars = set(chars)
+    bmp = sorted(char for char in chars if ord(char) <= 0xFFFF)
+    ranges = []
+    for code in sorted(ord(char) for char in chars if ord(char) > 0xFFFF):
+        if ranges and code - ranges[-1][1] <= 256:
+            ranges[-1][1] = code
+        else:
+            ranges.append([code, code])
+    return '[' + ''.join(map(re.escape, bmp)) + ''.join(
+        f'{re.escape(chr(lo))}-{re.escape(chr(hi))}' for lo, hi in ranges
+    ) + ']'
+
+
+# Character trie over every sequence in EMOJI_DATA, plus a regex for the
+# places one can start. The regex lets the C engine skip plain text (ASCII
+# starters such as keycap digits must be followed by a joiner code point);
+# the trie walk then takes the longest sequence at each hit, so ZWJ
+# sequences, skin tones, keycaps and flags count as one emoji.
+emoji_trie = _build_trie(emoji.EMOJI_DATA)
+_ascii_starts = [char for char in emoji_trie if char.isascii()]
+_ascii_seconds = {char for start in _ascii_starts for char in emoji_trie[start] if char}
+_starts = _char_class(char for char in emoji_trie if not char.isascii())
+start_regex = re.compile(_starts + '|' + _char_class(_ascii_starts) + '(?=' + _char_class(_ascii_seconds) + ')')
+# Lookahead-free form for vectorized .str.contains prefiltering
+candidate_pattern = _starts + '|' + _char_class(_ascii_starts) + _char_class(_ascii_seconds)
+
+
+def find_emojis(message):
+    found = []
+    match = start_regex.search(message)
+    while match:
+        pos = end = match.start()
+        node, word = emoji_trie, None
+        while end < len(message) and message[end] in node:
+            node = node[message[end]]
+            end += 1
+            if '' in node:
+                word, pos = node[''], end
+        if word is None:
+            pos += 1
+        else:
+            found.append(word)
+        match = start_regex.search(message, pos)
+    return found
+
+
+def count_emojis(messages):
+    counts = np.zeros(len(messages), dtype=np.int32)
+    positions = np.flatnonzero(messages.str.contains(candidate_pattern, regex=True).to_numpy(dtype=bool))
+    counts[positions] = [len(find_emojis(messages.iat[i])) for i in positions]
+    return counts
+
+
+def emoji_counts(messages, owners):
+    # One Counter of emojis per owner (e.g. user code) from a single scan
+    counts = {}
+    for owner, message in zip(owners, messages):
+        found = find_emojis(message)
+        if found:
+            counts.setdefault(owner, Counter()).update(found)
+    return counts
@@ -0,0 +1,57 @@
+import io
+import os
+import re
+import zipfile
+from contextlib import contextmanager
+
+# WhatsApp exports come as a bare .txt or as a .zip holding the chat text
+# next to the media files ("WhatsApp Chat with X.txt" on Android,
+# "_chat.txt" on iOS).
+chat_suffixes = ('.txt', '.zip')
+
+
+def chat_member(archive):
+    # The chat text inside an export archive: a .txt member, preferring one
+    # named like a chat, else the largest; media members are never opened
+    texts = [info for info in archive.infolist() if not info.is_dir() and info.filename.lower().endswith('.txt')]
+    if not texts:
+        raise ValueError("no chat .txt file found in the archive")
+    chats = [info for info in texts if 'chat' in os.path.basename(info.filename).lower()] or texts
+    return max(chats, key=lambda info: info.file_size)
+
+
+def chat_identity(name):
+    # Name of a chat that stays the same across its exports:
+    # 'WhatsApp Chat with Family (2).zip' and 'WhatsApp Chat - Family.zip'
+    # are both 'family'
+    stem = os.path.splitext(os.path.basename(name))[0]
+    stem = re.sub(r'\s*\(\d+\)$', '', stem)
+    stem = re.sub(r'^WhatsApp Chat( with| -)?\s*', '', stem, flags=re.I)
+    return stem.strip().lower()
+
+
+@contextmanager
+def open_chat(file, encoding='utf-8'):
+    # Text stream over a chat export (path or binary file object, .txt or
+    # .zip). Zip members are decompressed and decoded incrementally as the
+    # parser reads lines, so neither the whole text nor its bytes are held.
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, 'rb') as f:
+            with open_chat(f, encoding) as text:
+                yield text
+        return
+
+    file.seek(0)
+    if zipfile.is_zipfile(file):
+        file.seek(0)
+        with zipfile.ZipFile(file) as archive, archive.open(chat_member(archive)) as member:
+            yield io.TextIOWrapper(member, encoding=encoding)
+        return
+
+    file.seek(0)
+    text = io.TextIOWrapper(file, encoding=encoding)
+    try:
+        yield text
+    finally:
+        # Leave the caller's file object open
+        text.detach()
@@ -0,0 +1,25 @@
+import numpy as np
+import emojis
+import urls
+from profiling import stage
+
+media_message = '<Media omitted>'
+# Columns add_features() adds to a parsed frame
+feature_columns = ['n_chars', 'n_words', 'is_media', 'is_notification', 'n_urls', 'n_emojis']
+
+
+
+def add_features(df):
+    # Per-message counts and flags computed once at ingestion, so the helpers
+    # can answer with column sums instead of rescanning the text
+    messages = df['message']
+    with stage('features', rows=len(df)):
+        df['n_chars'] = messages.str.len().astype('int32')
+        df['n_words'] = np.fromiter((len(m.split()) for m in messages), dtype=np.int32, count=len(messages))
+        df['is_media'] = (messages == media_message).to_numpy()
+        df['is_notification'] = (df['user'] == 'group_notification').to_numpy()
+        with stage('urls', rows=len(df)):
+            df['n_urls'] = urls.count_urls(messages)
+        with stage('emojis', rows=len(df)):
+            df['n_emojis'] = emojis.count_emojis(messages)
+    return df
@@ -0,0 +1,105 @@
+import re
+from collections import Counter
+from functools import lru_cache
+
+# Export formats differ by platform and locale:
+#   Android  28/01/25, 6:45 pm - Emma: Hey         (or 24-hour, month first, 4-digit years)
+#   iOS      [28/01/2025, 18:45:12] Emma: Hey
+#   some locales drop the comma after the date: 28/01/2025 18:45 - Emma: Hey
+# detect_format() reads a sample of lines once and returns a ChatFormat whose
+# regex and datetime format are specific to that export, so parsing never
+# falls back to per-row format inference.
+
+_loose_timestamp = (r'(\d{1,2})([/.-])(\d{1,2})\2(\d{2,4})(,?) (\d{1,2}):(\d{2})(:\d{2})?'
+                    r'([ \u202f]?)([AaPp][Mm])?')
+_loose_headers = {
+    'android': re.compile(r'[\ufeff\u200e]?' + _loose_timestamp + r' - '),
+    'ios': re.compile(r'[\ufeff\u200e]?\[' + _loose_timestamp + r'\] '),
+}
+
+
+class ChatFormat:
+    # One export format. `pattern` finds every message of a block with the
+    # groups (timestamp, 'sender: ' prefix, sender, text); text runs over
+    # continuation lines up to the next header. `date_format` parses the
+    # timestamps once '\u202f' is replaced by a space.
+
+    def __init__(self, style='android', order='dmy', year_digits=2, clock=12, seconds=False, sep='/', ampm_space=' ', comma=','):
+        self.style, self.order, self.clock = style, order, clock
+        self.args = (style, order, year_digits, clock, seconds, sep, ampm_space, comma)
+        day, month = (r'%d', r'%m') if order == 'dmy' else (r'%m', r'%d')
+        self.date_format = (f'{day}{sep}{month}{sep}{"%y" if year_digits == 2 else "%Y"}{comma} '
+                            f'{"%I" if clock == 12 else "%H"}:%M{":%S" if seconds else ""}'
+                            f'{(" " if ampm_space else "") + "%p" if clock == 12 else ""}')
+
+        timestamp = (rf'\d{{1,2}}{re.escape(sep)}\d{{1,2}}{re.escape(sep)}\d{{{year_digits}}}{re.escape(comma)} '
+                     rf'\d{{1,2}}:\d{{2}}{":[0-9]{2}" if seconds else ""}')
+        if clock == 12:
+            timestamp += (r'[ \u202f]' if ampm_space else '') + '[AaPp][Mm]'
+        if style == 'ios':
+            head, tail = r'[\ufeff\u200e]?\[(' + timestamp + r')\] ', r'[\ufeff\u200e]?\[' + timestamp + r'\] '
+        else:
+            head, tail = r'[\ufeff\u200e]?(' + timestamp + r') - ', r'[\ufeff\u200e]?' + timestamp + r' - '
+        self.header = re.compile(tail)
+        self.pattern = re.compile(
+            '^' + head + r'(?=.)((.*?): )?(.*(?:\n(?!' + tail + r').*)*)', re.M
+        )
+
+    def with_order(self, order):
+        # The same profile with day/month order `order`
+        style, _, *rest = self.args
+        return get_format(style, order, *rest)
+
+    def __repr__(self):
+        return f'ChatFormat({self.style!r}, {self.date_format!r})'
+
+
+@lru_cache(maxsize=None)
+def get_format(style='android', order='dmy', year_digits=2, clock=12, seconds=False, sep='/', ampm_space=' ', comma=','):
+    # Profiles are compiled once and shared
+    return ChatFormat(style, order, year_digits, clock, seconds, sep, ampm_space, comma)
+
+
+default_format = get_format()
+
+
+# Header lines whose first (or second) date field can only be a day
+_over_12 = r'(?:1[3-9]|2\d|3[01])'
+_settling_headers = {
+    'dmy': re.compile(r'^[\ufeff\u200e]?\[?' + _over_12 + r'[/.-]\d{1,2}[/.-]\d{2,4},? \d{1,2}:\d{2}', re.M),
+    'mdy': re.compile(r'^[\ufeff\u200e]?\[?\d{1,2}[/.-]' + _over_12 + r'[/.-]\d{2,4},? \d{1,2}:\d{2}', re.M),
+}
+
+
+def settle_order(text):
+    # 'dmy' or 'mdy' from the first header line in text with a day above 12;
+    # None while every date could be read either way
+    found = {order: header.search(text) for order, header in _settling_headers.items()}
+    found = {order: m.start() for order, m in found.items() if m}
+    return min(found, key=found.get) if found else None
+
+
+def detect_format(lines):
+    # Picks the profile matching most of the sampled header lines. Day/month
+    # order comes from any field above 12; an ambiguous sample is read
+    # day-first like the original parser.
+    matches = {style: [m for m in map(header.match, lines) if m] for style, header in _loose_headers.items()}
+    style, found = max(matches.items(), key=lambda item: len(item[1]))
+    if not found:
+        return default_format
+
+    def most_common(values):
+        return Counter(values).most_common(1)[0][0]
+
+    first, second = max(int(m[1]) for m in found), max(int(m[3]) for m in found)
+    clock = 12 if any(m[10] for m in found) else 24
+    return get_format(
+        style=style,
+        order='mdy' if second > 12 and first <= 12 else 'dmy',
+        year_digits=4 if most_common(len(m[4]) for m in found) == 4 else 2,
+        clock=clock,
+        seconds=most_common(bool(m[8]) for m in found),
+        sep=most_common(m[2] for m in found),
+        ampm_space=' ' if clock == 12 and most_common(bool(m[9]) for m in found) else '',
+        comma=most_common(m[5] for m in found),
+    )
@@ -1,180 +1,361 @@
-from urlextract import URLExtract
-from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+import io
+import threading
+import numpy as np
 import pandas as pd
-from collections import Counter
+from collections import Counter, OrderedDict
 from wordcloud import WordCloud
 from PIL import Image, ImageDraw
-import emoji
-
-extractor = URLExtract()
-analyzer = SentimentIntensityAnalyzer()
+import emojis
+from chat_index import ChatIndex
+from tokens import TokenStore
+import urls
+import sentiment
+from preprocessor import month_names, day_names, periods
+from timecube import TimeCube
+
+def _select(df, selected_user):
+    # Rows of one user; accepts a plain frame or a prebuilt ChatIndex
+    if isinstance(df, ChatIndex):
+        return df.rows(selected_user)
+    if selected_user != 'Overall':
+        df = df[df['user'] == selected_user]
+    return df
+
+def _column(df, selected_user, column):
+    # One column of a user's rows; a ChatIndex is read at the user's
+    # positions without copying the rest of the frame
+    if isinstance(df, ChatIndex):
+        values = df.df[column]
+        return values if selected_user == 'Overall' else values.iloc[df.positions(selected_user)]
+    return _select(df, selected_user)[column]
+
+def _tokens(df, selected_user, text_only=True):
+    # Token store plus the positions of the user's messages in it; text_only
+    # leaves out system messages and media
+    if isinstance(df, ChatIndex):
+        positions = df.positions(selected_user)
+        if text_only:
+            chat = df.df
+            skip = chat['is_notification'].to_numpy() | chat['is_media'].to_numpy()
+            positions = positions[~skip[positions]]
+        return df.tokens, positions
+
+    df = _select(df, selected_user)
+    if text_only:
+        df = df[~(df['is_notification'] | df['is_media'])]
+    return TokenStore(df['message'], df['n_words']), None
 
 def fetch_stats(df, selected_user):
-    if selected_user != "Overall":
-        df = df[df['user'] == selected_user]
+    n_words = _column(df, selected_user, 'n_words')
 
-    num_messages = df.shape[0]
-    words = [word for message in df['message'] for word in message.split()]
-    media_messages = df[df['message'] == '<Media omitted>'].shape[0]
-    links = [url for message in df['message'] for url in extractor.find_urls(message)]
+    num_messages = len(n_words)
+    words = int(n_words.sum())
+    media_messages = int(_column(df, selected_user, 'is_media').sum())
+    links = int(_column(df, selected_user, 'n_urls').sum())
 
-    return num_messages, len(words), media_messages, len(links)
+    return num_messages, words, media_messages, links
 
 def most_busy_users(df):
-    top_users = df['user'].value_counts().head()
-    user_percent = round((df['user'].value_counts() / df.shape[0]) * 100, 2)
+    df = _select(df, 'Overall')
+    counts = df['user'].value_counts()
+    counts = counts[counts > 0]
+    top_users = counts.head()
+    user_percent = round((counts / df.shape[0]) * 100, 2)
     user_percent_df = user_percent.reset_index().rename(columns={'index': 'name', 'user': 'percent'})
     return top_users, user_percent_df
 
-def create_wordcloud(selected_user, df):
-    # Load stop words
-    with open('stop_hinglish.txt', 'r') as f:
-        stop_words = f.read().splitlines()
-
-    # Remove system messages and media
-    df = df[(df['user'] != 'group_notification') & (df['message'] != '<Media omitted>')]
-
-    # Remove stop words
-    def remove_stop_words(message):
-        words = message.lower().split()
-        return " ".join([word for word in words if word not in stop_words])
-
-    df['cleaned_message'] = df['message'].apply(remove_stop_words)
+# Rendered wordclouds per (chat key, user, width, height), least recently used first
+wordcloud_images = OrderedDict()
+wordcloud_cache_size = 32
+_wordcloud_lock = threading.Lock()
+
+def create_wordcloud(selected_user, df, width=500, height=500):
+    # Only chats with a content key (ChatIndex built by the app) are cached
+    key = (df.key, selected_user, width, height) if isinstance(df, ChatIndex) and df.key else None
+    if key is not None:
+        with _wordcloud_lock:
+            if key in wordcloud_images:
+                wordcloud_images.move_to_end(key)
+                return wordcloud_images[key]
+
+    img = _render_wordcloud(selected_user, df, width, height)
+    if key is not None:
+        with _wordcloud_lock:
+            wordcloud_images[key] = img
+            while len(wordcloud_images) > wordcloud_cache_size:
+                wordcloud_images.popitem(last=False)
+    return img
 
+def _render_wordcloud(selected_user, df, width, height, max_words=200):
     # First check before user filter
-    all_text = " ".join(df['cleaned_message'])
-    if len(all_text.split()) < 5:
-        return create_placeholder_image("Not enough total words")
+    tokens, positions = _tokens(df, 'Overall')
+    if tokens.word_counts(positions).sum() < 5:
+        return create_placeholder_image("Not enough total words", width, height)
 
     # Filter by user if needed
     if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
-        all_text = " ".join(df['cleaned_message'])
-        if len(all_text.split()) < 5:
-            return create_placeholder_image(f"No significant words used by {selected_user}")
+        tokens, positions = _tokens(df, selected_user)
+        if tokens.word_counts(positions).sum() < 5:
+            return create_placeholder_image(f"No significant words used by {selected_user}", width, height)
+
+    # Word frequencies straight from the token store (no stop words, system
+    # messages or media); only the top max_words can be drawn anyway
+    counts, vocab = tokens.cloud_counts(positions)
+    top = np.flatnonzero(counts)
+    if len(top) > max_words:
+        top = top[np.argsort(-counts[top], kind='stable')[:max_words]]
 
     # Generate word cloud
     try:
-        wc = WordCloud(width=500, height=500, min_font_size=10, background_color='white')
-        img = wc.generate(all_text).to_image()
+        wc = WordCloud(width=width, height=height, min_font_size=10, background_color='white', max_words=max_words)
+        img = wc.generate_from_frequencies(dict(zip(vocab[top], counts[top].tolist()))).to_image()
         return img
     except ValueError:
-        return create_placeholder_image("Error: No valid words")
+        return create_placeholder_image("Error: No valid words", width, height)
 
 # Helper function to create a placeholder image
-def create_placeholder_image(text):
-    img = Image.new('RGB', (500, 500), color='white')
+def create_placeholder_image(text, width=500, height=500):
+    img = Image.new('RGB', (width, height), color='white')
     draw = ImageDraw.Draw(img)
-    draw.text((30, 230), text, fill='black')
+    draw.text((30, height // 2 - 20), text, fill='black')
     return img
 
 def most_common_words(selected_user, df):
-    stop_words = open('stop_hinglish.txt', 'r').read()
+    tokens, positions = _tokens(df, selected_user)
+    return pd.DataFrame(tokens.most_common(positions, 20))
 
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
-
-    temp = df[(df['user'] != 'group_notification') & (df['message'] != '<Media omitted>')]
-    words = [word for message in temp['message'] for word in message.lower().split() if word not in stop_words]
+def emoji_helper(selected_user, df):
+    if isinstance(df, ChatIndex):
+        counts = df.emoji_counts.get(selected_user, Counter())
+    else:
+        df = _select(df, selected_user)
+        # Only messages known to contain emojis are scanned
+        counts = Counter(e for message in df.loc[df['n_emojis'] > 0, 'message'] for e in emojis.find_emojis(message))
+
+    if len(counts) == 0:
+        text = f"{selected_user} didn't send any emojis."
+        return text
 
-    return pd.DataFrame(Counter(words).most_common(20))
+    return pd.DataFrame(counts.most_common(len(counts)))
 
-def emoji_helper(selected_user, df):
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
+def top_domains(selected_user, df, n=10):
+    # Only messages already known to hold links are scanned
+    if isinstance(df, ChatIndex):
+        positions = df.positions(selected_user)
+        positions = positions[df.df['n_urls'].to_numpy()[positions] > 0]
+        domains = urls.domain_counts(df.df['message'].iloc[positions])
+    else:
+        df = _select(df, selected_user)
+        domains = urls.domain_counts(df.loc[df['n_urls'] > 0, 'message'])
 
-    emojis = [char for message in df['message'] for char in message if char in emoji.EMOJI_DATA]
+    if len(domains) == 0:
+        return f"{selected_user} didn't share any links."
 
-    if len(emojis) == 0:
-        text = f"{selected_user} didn't send any emojis."
-        return text
+    return pd.DataFrame(domains.most_common(n))
 
-    return pd.DataFrame(Counter(emojis).most_common(len(Counter(emojis))))
+def _time_grid(df, selected_user):
+    # Day x hour message counts of the user, plus the cube (and its calendar)
+    # they come from
+    if isinstance(df, ChatIndex):
+        return df.time_cube, df.time_grid(selected_user)
+    cube = TimeCube(_select(df, selected_user)['date_time'])
+    return cube, cube.overall
 
 def monthly_timeline(selected_user, df):
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
+    cube, grid = _time_grid(df, selected_user)
 
-    timeline = df.groupby(['year', 'month_num', 'month']).count()['message'].reset_index()
-    timeline['time'] = timeline.apply(lambda row: f"{row['month']}-{row['year']}", axis=1)
+    days = pd.DataFrame({'year': cube.year, 'month_num': cube.month, 'message': grid.sum(axis=1)})
+    timeline = days.groupby(['year', 'month_num'], as_index=False)['message'].sum()
+    timeline = timeline[timeline['message'] > 0].reset_index(drop=True)
+    # str dtype even with no months, so the concatenation below works on an empty chat
+    timeline.insert(2, 'month', pd.Series([month_names[m - 1] for m in timeline['month_num']], dtype=str, index=timeline.index))
+    timeline['time'] = timeline['month'] + '-' + timeline['year'].astype(str)
 
     return timeline
 
 def daily_timeline(selected_user, df):
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
-
-    return df.groupby('date').count()['message'].reset_index()
+    cube, grid = _time_grid(df, selected_user)
+
+    per_day = grid.sum(axis=1)
+    active = per_day > 0
+    return pd.DataFrame({'date': cube.dates[active], 'message': per_day[active]})
+
+def _lttb(x, y, n_out):
+    # Largest-Triangle-Three-Buckets: indices of n_out points that keep the
+    # shape of the (x, y) line; the first and last points are always kept
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    edges = np.append(edges, n)
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_x, next_y = x[hi:edges[i + 2]].mean(), y[hi:edges[i + 2]].mean()
+        area = np.abs((x[a] - next_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (next_y - y[a]))
+        a = lo + int(area.argmax())
+        keep[i + 1] = a
+    return keep
+
+def downsample(timeline, y_col='message', max_points=1000):
+    # At most max_points rows of a timeline, picked with LTTB
+    keep = _lttb(np.arange(len(timeline)), timeline[y_col].to_numpy(), max_points)
+    return timeline.iloc[keep]
+
+def resample_timeline(timeline, max_points=1000):
+    # Daily timeline summed per week, then per month, until it fits
+    # max_points (LTTB picks points past that); returns (frame, label)
+    dates = timeline['date'].to_numpy().astype('datetime64[D]')
+    counts = timeline['message'].to_numpy()
+    label = 'Daily'
+    periods = {
+        'Weekly': lambda d: d - (d.astype(np.int64) + 3) % 7,
+        'Monthly': lambda d: d.astype('datetime64[M]').astype('datetime64[D]'),
+    }
+    for name, period in periods.items():
+        if len(dates) <= max_points:
+            break
+        starts = period(dates)
+        first = np.flatnonzero(np.r_[True, starts[1:] != starts[:-1]])
+        dates, counts, label = starts[first], np.add.reduceat(counts, first), name
+    resampled = pd.DataFrame({'date': pd.DatetimeIndex(dates), 'message': counts})
+    return downsample(resampled, 'message', max_points), label
+
+def _counts(values, labels, name):
+    # Non-zero counts as a Series shaped like value_counts()
+    counts = pd.Series(values.astype('int64'), index=pd.Index(labels, name=name), name='count')
+    return counts[counts > 0]
 
 def week_activity_map(selected_user, df):
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
+    cube, grid = _time_grid(df, selected_user)
 
-    return df['day_name'].value_counts()
+    counts = np.bincount(cube.weekday, weights=grid.sum(axis=1), minlength=7)
+    return _counts(counts, day_names, 'day_name').sort_values(ascending=False, kind='stable')
 
 def month_activity_map(selected_user, df):
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
+    cube, grid = _time_grid(df, selected_user)
 
-    return df['month'].value_counts()
+    counts = np.bincount(cube.month - 1, weights=grid.sum(axis=1), minlength=12)
+    return _counts(counts, month_names, 'month').sort_values(ascending=False, kind='stable')
 
 def activity_heatmap(selected_user, df):
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
+    cube, grid = _time_grid(df, selected_user)
 
-    return df.pivot_table(index='day_name', columns='period', values='message', aggfunc='count').fillna(0)
+    heatmap = pd.DataFrame(
+        cube.weekday_hour(grid).astype(float),
+        index=pd.Index(day_names, name='day_name'),
+        columns=pd.Index(periods, name='period'),
+    )
+    return heatmap.loc[heatmap.sum(axis=1) > 0, heatmap.sum(axis=0) > 0]
 
 def average_messages_per_day(user, df):
-    if user != "Overall":
-        df = df[df['user'] == user]
-    daily_count = df.groupby('date').count()['message']
-    return daily_count.mean()
+    cube, grid = _time_grid(df, user)
+    daily_count = grid.sum(axis=1)
+    return pd.Series(daily_count[daily_count > 0]).mean()
 
 def hourly_activity(user, df):
-    if user != "Overall":
-        df = df[df['user'] == user]
-    return df['hour'].value_counts().sort_index()
+    cube, grid = _time_grid(df, user)
+    return _counts(grid.sum(axis=0), range(24), 'hour')
 
 def message_length_distribution(user, df):
-    if user != "Overall":
-        df = df[df['user'] == user]
-    df['message_length'] = df['message'].apply(len)
-    return df['message_length']
+    return _column(df, user, 'n_chars').rename('message_length')
 
-def day_of_month_activity(user, df):
-    if user != "Overall":
-        df = df[df['user'] == user]
-    return df['date'].dt.day.value_counts().sort_index()
+def message_length_histogram(user, df, bins=30):
+    # Message lengths binned with NumPy: one row per bin instead of per message
+    lengths = _column(df, user, 'n_chars').to_numpy()
+    counts, edges = np.histogram(lengths, bins=bins)
+    return pd.DataFrame({'start': edges[:-1], 'end': edges[1:], 'count': counts})
 
 def lexical_richness(user, df):
-    if user != "Overall":
-        df = df[df['user'] == user]
-    total_words = df['message'].apply(lambda x: len(x.split())).sum()
-    unique_words = df['message'].apply(lambda x: len(set(x.split()))).sum()
-    return unique_words / total_words if total_words else 0
+    tokens, positions = _tokens(df, user, text_only=False)
+    return tokens.lexical_richness(positions)
 
 def day_of_month_activity(user, df):
-    if user != "Overall":
-        df = df[df['user'] == user]
-    if not pd.api.types.is_datetime64_any_dtype(df['date']):
-        df['date'] = pd.to_datetime(df['date'])
-    return df['date'].dt.day.value_counts().sort_index()
-
-def sentiment_analysis(user, df):
-    if user != "Overall":
-        df = df[df['user'] == user]
-
-    def get_sentiment(text):
-        score = analyzer.polarity_scores(text)
-        if score['compound'] >= 0.05:
-            return 'Positive'
-        elif score['compound'] <= -0.05:
-            return 'Negative'
-        else:
-            return 'Neutral'
-
-    df['Sentiment'] = df['message'].apply(get_sentiment)
-    sentiment_counts = df['Sentiment'].value_counts()
-    return sentiment_counts, df[['user', 'message', 'Sentiment']]
-
-
+    cube, grid = _time_grid(df, user)
+    counts = np.bincount(cube.day, weights=grid.sum(axis=1), minlength=32)[1:]
+    return _counts(counts, range(1, 32), 'date')
+
+def _conversations(df, gap_minutes):
+    chat = df if isinstance(df, ChatIndex) else ChatIndex(df)
+    return chat, chat.conversations(gap_minutes)
+
+def session_stats(selected_user, df, gap_minutes=30):
+    # Sessions are runs of messages without gap_minutes of silence; for a
+    # user, the ones they started
+    chat, conversations = _conversations(df, gap_minutes)
+    started = np.ones(len(conversations), dtype=bool)
+    if selected_user != 'Overall':
+        started = conversations.session_initiator == chat.user_code(selected_user)
+    minutes = (conversations.session_end - conversations.session_start)[started] / np.timedelta64(1, 'm')
+    messages = conversations.session_messages[started]
+    return {
+        'sessions': int(started.sum()),
+        'median_minutes': float(np.median(minutes)) if len(minutes) else 0.0,
+        'avg_messages': float(messages.mean()) if len(messages) else 0.0,
+        'per_week': len(minutes) / max(chat.time_cube.n_days / 7, 1),
+    }
+
+def reply_latency(df, gap_minutes=30):
+    # Replies sent and median minutes to reply per user, most replies first
+    chat, conversations = _conversations(df, gap_minutes)
+    counts, medians = conversations.median_latency()
+    latency = pd.DataFrame({
+        'user': chat.users,
+        'replies': counts.astype('int64'),
+        'median_reply_minutes': np.round(medians / 60, 1),
+    })
+    latency = latency[latency['replies'] > 0]
+    return latency.sort_values('replies', ascending=False, kind='stable').reset_index(drop=True)
+
+def reply_pairs(df, gap_minutes=30):
+    # Sparse who-replies-to-whom counts, one row per (from, to) pair
+    chat, conversations = _conversations(df, gap_minutes)
+    senders, receivers, counts = conversations.reply_matrix()
+    users = np.array(chat.users, dtype=object)
+    pairs = pd.DataFrame({'from': users[senders], 'to': users[receivers], 'replies': counts.astype('int64')})
+    return pairs.sort_values('replies', ascending=False, kind='stable').reset_index(drop=True)
+
+def sentiment_analysis(user, df, workers=None, store=None):
+    # Compound scores come from the chat's already scored rows, then the score
+    # store, and only unseen message texts are run through VADER
+    if isinstance(df, ChatIndex):
+        # Only the two columns of the table are taken at the user's rows
+        rows = df.df[['user', 'message']]
+        if user != 'Overall':
+            rows = rows.iloc[df.positions(user)]
+        compound = df.sentiment_scores(user, workers=workers, store=store)
+    else:
+        rows = _select(df, user)
+        compound = (store or sentiment.default_store).scores(rows['message'], workers=workers)
+    result = rows[['user', 'message']].assign(Sentiment=sentiment.label(compound), Compound=compound)
+
+    sentiment_counts = result['Sentiment'].value_counts()
+    return sentiment_counts, result
+
+def sentiment_rows(result, sentiments=None, users=None, order=None):
+    # Positions of the sentiment_analysis rows that pass the filters, sorted
+    # by compound score for order 'desc'/'asc' (chat order otherwise), so a
+    # page of the table is result.iloc[positions[start:stop]]
+    keep = np.ones(len(result), dtype=bool)
+    if sentiments:
+        keep &= result['Sentiment'].isin(sentiments).to_numpy()
+    if users:
+        keep &= result['user'].isin(users).to_numpy()
+    positions = np.flatnonzero(keep)
+    if order in ('desc', 'asc'):
+        compound = result['Compound'].to_numpy()[positions]
+        positions = positions[np.argsort(-compound if order == 'desc' else compound, kind='stable')]
+    return positions
+
+def sentiment_export(result, positions=None, fmt='csv'):
+    # The (filtered) table as CSV or Parquet bytes, written in chunks
+    rows = result if positions is None else result.iloc[positions]
+    buffer = io.BytesIO()
+    if fmt == 'parquet':
+        rows.to_parquet(buffer, index=False)
+    else:
+        rows.to_csv(buffer, index=False, chunksize=50_000, encoding='utf-8')
+    return buffer.getvalue()
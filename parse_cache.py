@@ -0,0 +1,92 @@
+import hashlib
+import os
+from collections import OrderedDict
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401  (needed by DataFrame.to_parquet)
+except ImportError:
+    pyarrow = None
+
+
+# Part of every Parquet file name; bump it when the parsed frame's columns
+# or dtypes change, so files written by an older parser are never read
+schema_version = 2
+
+
+def content_hash(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class ParseCache:
+    # Parsed chat frames keyed by a hash of the raw export. Frames live in an
+    # in-process LRU; with a cache_dir they are also kept as Parquet files,
+    # evicting the least recently used ones once max_disk_bytes is exceeded.
+    # A file missing any of `columns` counts as a miss.
+
+    def __init__(self, max_entries=8, cache_dir=None, max_disk_bytes=512 * 1024 ** 2, columns=()):
+        self.max_entries = max_entries
+        self.columns = list(columns)
+        self.cache_dir = cache_dir if cache_dir and pyarrow is not None else None
+        self.max_disk_bytes = max_disk_bytes
+        self._frames = OrderedDict()
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.v{schema_version}.parquet")
+
+    def get(self, key):
+        if key in self._frames:
+            self._frames.move_to_end(key)
+            return self._frames[key]
+
+        if self.cache_dir and os.path.exists(self._path(key)):
+            try:
+                df = pd.read_parquet(self._path(key))
+            except (OSError, ValueError):
+                os.remove(self._path(key))
+                return None
+            if not set(self.columns) <= set(df.columns):
+                os.remove(self._path(key))
+                return None
+            os.utime(self._path(key))
+            self._remember(key, df)
+            return df
+
+        return None
+
+    def put(self, key, df):
+        self._remember(key, df)
+        if self.cache_dir:
+            tmp_path = self._path(key) + '.tmp'
+            df.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, self._path(key))
+            self._evict_disk()
+
+    def get_or_parse(self, key, parse):
+        df = self.get(key)
+        if df is None:
+            df = parse()
+            self.put(key, df)
+        return df
+
+    def _remember(self, key, df):
+        self._frames[key] = df
+        self._frames.move_to_end(key)
+        while len(self._frames) > self.max_entries:
+            self._frames.popitem(last=False)
+
+    def _evict_disk(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.parquet'):
+                stat = os.stat(os.path.join(self.cache_dir, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            os.remove(os.path.join(self.cache_dir, name))
+            total -= size
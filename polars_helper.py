@@ -0,0 +1,193 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from chat_index import ChatIndex
+from tokens import load_stop_words
+from preprocessor import month_names, day_names, periods
+from helper import (_counts, create_wordcloud, create_placeholder_image, emoji_helper, top_domains,
+                    message_length_distribution, sentiment_analysis, sentiment_rows, sentiment_export,
+                    downsample, resample_timeline, session_stats, reply_latency, reply_pairs)
+
+try:
+    import polars as pl
+except ImportError:
+    pl = None
+
+# Polars engine for the helper functions: same names, arguments and return
+# values as helper.py (the reference), with the counting done by lazy,
+# multithreaded Polars queries over an Arrow copy of the chat. URL, emoji,
+# sentiment, wordcloud and conversation work comes from helper.
+
+columns = ['date_time', 'user', 'message', 'n_words', 'n_chars', 'n_urls', 'is_media', 'is_notification']
+whitespace_token = r'\S+'
+
+# Polars frames per chat key, least recently used first
+frames = OrderedDict()
+frame_cache_size = 8
+_frames_lock = threading.Lock()
+_stop_words = None
+
+
+def _to_polars(df):
+    frame = pl.from_pandas(df[columns].assign(user=df['user'].astype(str)))
+    return frame.with_columns(pl.col('date_time').cast(pl.Datetime('ns')))
+
+
+def _frame(df):
+    # Arrow-backed copy of a chat, converted once per ChatIndex key
+    if not isinstance(df, ChatIndex):
+        return _to_polars(df)
+    if df.key is None:
+        return _to_polars(df.df).with_columns(code=pl.Series(df.codes))
+    with _frames_lock:
+        if df.key in frames:
+            frames.move_to_end(df.key)
+            return frames[df.key]
+    frame = _to_polars(df.df).with_columns(code=pl.Series(df.codes))
+    with _frames_lock:
+        frames[df.key] = frame
+        while len(frames) > frame_cache_size:
+            frames.popitem(last=False)
+    return frame
+
+
+def _select(df, selected_user):
+    rows = _frame(df).lazy()
+    if selected_user == 'Overall':
+        return rows
+    if isinstance(df, ChatIndex):
+        # Integer user codes compare faster than names
+        return rows.filter(pl.col('code') == (-1 if df.user_code(selected_user) is None else df.user_code(selected_user)))
+    return rows.filter(pl.col('user') == selected_user)
+
+
+def _count_by(df, selected_user, *keys):
+    # Message counts per key expression, as numpy arrays (keys..., count)
+    counts = _select(df, selected_user).group_by(keys, maintain_order=True).agg(pl.len()).collect()
+    return [counts[name].to_numpy() for name in counts.columns]
+
+
+def fetch_stats(df, selected_user):
+    stats = _select(df, selected_user).select(
+        pl.len(),
+        pl.col('n_words').sum(),
+        pl.col('is_media').sum(),
+        pl.col('n_urls').sum(),
+    ).collect().row(0)
+    return tuple(int(value) for value in stats)
+
+
+def most_busy_users(df):
+    users, n = _count_by(df, 'Overall', pl.col('user'))
+    total = len(df)
+    user_dtype = (df.df if isinstance(df, ChatIndex) else df)['user'].dtype
+    counts = pd.Series(n.astype('int64'), index=pd.Index(users, name='user').astype(user_dtype), name='count')
+    counts = counts[counts > 0].sort_values(ascending=False, kind='stable')
+    top_users = counts.head()
+    user_percent = round((counts / total) * 100, 2)
+    user_percent_df = user_percent.reset_index().rename(columns={'index': 'name', 'user': 'percent'})
+    return top_users, user_percent_df
+
+
+def most_common_words(selected_user, df):
+    global _stop_words
+    if _stop_words is None:
+        _stop_words = load_stop_words()
+    words = (
+        _select(df, selected_user)
+        .filter(~(pl.col('is_notification') | pl.col('is_media')))
+        .select(pl.col('message').str.extract_all(whitespace_token).explode().str.to_lowercase().alias('word'))
+        .drop_nulls()
+        .filter(~pl.col('word').is_in(list(_stop_words)))
+        .group_by('word', maintain_order=True).agg(pl.len().alias('count'))
+        # Equal counts alphabetically, as in helper
+        .sort(['count', 'word'], descending=[True, False])
+        .head(20)
+        .collect()
+    )
+    return pd.DataFrame(list(zip(words['word'].to_list(), words['count'].to_numpy().astype(np.int64))))
+
+
+def monthly_timeline(selected_user, df):
+    dt = pl.col('date_time').dt
+    year, month, message = _count_by(df, selected_user, dt.year().alias('year'), dt.month().alias('month_num'))
+    order = np.lexsort((month, year))
+    timeline = pd.DataFrame({
+        'year': year[order].astype(np.int32),
+        'month_num': month[order].astype(np.int32),
+        'message': message[order].astype(np.int64),
+    })
+    # str dtype even with no months, so the concatenation below works on an empty chat
+    timeline.insert(2, 'month', pd.Series([month_names[m - 1] for m in timeline['month_num']], dtype=str, index=timeline.index))
+    timeline['time'] = timeline['month'] + '-' + timeline['year'].astype(str)
+    return timeline
+
+
+def _per_day(df, selected_user):
+    day, count = _count_by(df, selected_user, pl.col('date_time').dt.date().alias('date'))
+    order = np.argsort(day)
+    return day[order].astype('datetime64[D]'), count[order].astype(np.int64)
+
+
+def daily_timeline(selected_user, df):
+    days, counts = _per_day(df, selected_user)
+    return pd.DataFrame({'date': pd.DatetimeIndex(days), 'message': counts})
+
+
+def _bincount(df, selected_user, key, length, offset=0):
+    values, counts = _count_by(df, selected_user, key)
+    return np.bincount(values.astype(np.int64) - offset, weights=counts, minlength=length)
+
+
+def week_activity_map(selected_user, df):
+    counts = _bincount(df, selected_user, pl.col('date_time').dt.weekday(), 7, offset=1)
+    return _counts(counts, day_names, 'day_name').sort_values(ascending=False, kind='stable')
+
+
+def month_activity_map(selected_user, df):
+    counts = _bincount(df, selected_user, pl.col('date_time').dt.month(), 12, offset=1)
+    return _counts(counts, month_names, 'month').sort_values(ascending=False, kind='stable')
+
+
+def activity_heatmap(selected_user, df):
+    dt = pl.col('date_time').dt
+    weekday, hour, count = _count_by(df, selected_user, dt.weekday().alias('weekday'), dt.hour().alias('hour'))
+    grid = np.zeros((7, 24))
+    grid[weekday.astype(np.int64) - 1, hour.astype(np.int64)] = count
+
+    heatmap = pd.DataFrame(
+        grid,
+        index=pd.Index(day_names, name='day_name'),
+        columns=pd.Index(periods, name='period'),
+    )
+    return heatmap.loc[heatmap.sum(axis=1) > 0, heatmap.sum(axis=0) > 0]
+
+
+def average_messages_per_day(user, df):
+    days, counts = _per_day(df, user)
+    return pd.Series(counts).mean()
+
+
+def hourly_activity(user, df):
+    return _counts(_bincount(df, user, pl.col('date_time').dt.hour(), 24), range(24), 'hour')
+
+
+def day_of_month_activity(user, df):
+    counts = _bincount(df, user, pl.col('date_time').dt.day(), 31, offset=1)
+    return _counts(counts, range(1, 32), 'date')
+
+
+def message_length_histogram(user, df, bins=30):
+    lengths = _select(df, user).select('n_chars').collect()['n_chars'].to_numpy()
+    counts, edges = np.histogram(lengths, bins=bins)
+    return pd.DataFrame({'start': edges[:-1], 'end': edges[1:], 'count': counts})
+
+
+def lexical_richness(user, df):
+    tokens = pl.col('message').str.extract_all(whitespace_token)
+    unique, total = _select(df, user).select(
+        tokens.list.n_unique().sum(),
+        tokens.list.len().sum().alias('total'),
+    ).collect().row(0)
+    return unique / total if total else 0
@@ -1,50 +1,242 @@
-import re
+from collections import Counter
+from datetime import datetime
+from itertools import chain, islice
+import numpy as np
 import pandas as pd
+from pandas.api.types import union_categoricals
+from features import add_features
+from formats import default_format, detect_format, settle_order
+from profiling import stage
 
-def preprocessor(data):
-    pattern = r'(\d{1,2}/\d{1,2}/\d{2,4},\s\d{1,2}:\d{2}\s?(?:am|pm))\s-\s(.+)'
-    matches = re.findall(pattern, data)
-
-    # Clean non-breaking spaces
-    cleaned_matches = [(t.replace('\u202f', ' '), msg) for t, msg in matches]
-    df = pd.DataFrame(cleaned_matches, columns=['date_time', 'Message'])
-
-    users, messages = [], []
-    user_pattern = r'^[\d\s()+-]+$'
-
-    for message in df['Message']:
-        parts = message.split(': ', 1)
-
-        if len(parts) == 2:
-            user_candidate, msg_text = parts[0].strip(), parts[1].strip()
-            if re.match(user_pattern, user_candidate) or user_candidate:
-                users.append(user_candidate)
-                messages.append(msg_text)
-            else:
-                users.append('group_notification')
-                messages.append(message.strip())
-        else:
-            users.append('group_notification')
-            messages.append(message.strip())
-
-    df['user'] = users
-    df['message'] = messages
-    df.drop(columns=['Message'], inplace=True)
-
-    # Convert date_time and extract components
-    df['date_time'] = pd.to_datetime(df['date_time'], format='%d/%m/%y, %I:%M %p')
-    df['date'] = df['date_time'].dt.date
-    df['date'] = pd.to_datetime(df['date'])
-    df['time'] = df['date_time'].dt.time
-    df['year'] = df['date_time'].dt.year
-    df['month_num'] = df['date_time'].dt.month
-    df['month'] = df['date_time'].dt.month_name()
-    df['day'] = df['date_time'].dt.day
-    df['hour'] = df['date_time'].dt.hour
-    df['minute'] = df['date_time'].dt.minute
-    df['day_name'] = df['date_time'].dt.day_name()
+# Lines read to detect the export format
+sample_lines = 1000
+
+
+def _parse_block(data, fmt=default_format):
+    # The format's pattern yields (timestamp, 'sender: ', sender, text) per
+    # message, with continuation lines already attached to the text
+    with stage('regex') as record:
+        if '\r' in data:
+            data = data.replace('\r\n', '\n')
+        matches = fmt.pattern.findall(data)
+        df = pd.DataFrame(matches, columns=['date_time', 'prefix', 'user', 'message'])
+        record['rows'] = len(df)
+
+    with stage('split', rows=len(df)):
+        users = df['user'].str.strip()
+        messages = df['message'].str.strip()
+        if fmt.style == 'ios':
+            # iOS marks attachments and system text with a left-to-right mark
+            messages = messages.str.lstrip('\u200e')
+
+        # Lines without a sender (or with a blank one) are group notifications
+        # and keep their full text
+        no_user = users == ''
+        blank_user = no_user & (df['prefix'] != '')
+        messages[blank_user] = (df['prefix'][blank_user] + df['message'][blank_user]).str.strip()
+        users[no_user] = 'group_notification'
+
+    with stage('datetime', rows=len(df)):
+        # Clean non-breaking spaces
+        date_time = df['date_time'].str.replace('\u202f', ' ', regex=False)
+        date_time = pd.to_datetime(date_time, format=fmt.date_format)
+    return pd.DataFrame({
+        'date_time': date_time,
+        'user': users,
+        'message': messages,
+    })
+
+
+month_names = ['January', 'February', 'March', 'April', 'May', 'June', 'July',
+               'August', 'September', 'October', 'November', 'December']
+day_names = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+periods = [f"{h:02d}-{'00' if h == 23 else f'{(h + 1) % 24:02d}'}" for h in range(24)]
+
+
+def _add_date_parts(df, compact=False):
+    with stage('date_parts', rows=len(df)):
+        return _date_parts(df, compact)
+
+
+def _date_parts(df, compact):
+    dt = df['date_time'].dt
+    df['date'] = dt.normalize()
+
+    if compact:
+        # Categories for the repeated labels, small ints for calendar parts;
+        # time and minute are left out as nothing reads them
+        df['user'] = df['user'].astype('category')
+        df['year'] = dt.year.astype('int16')
+        df['month_num'] = dt.month.astype('int8')
+        df['month'] = pd.Categorical.from_codes(df['month_num'] - 1, month_names)
+        df['day'] = dt.day.astype('int8')
+        df['hour'] = dt.hour.astype('int8')
+        df['day_name'] = pd.Categorical.from_codes(dt.dayofweek, day_names)
+        df['period'] = pd.Categorical.from_codes(df['hour'], periods)
+        return df
+
+    df['time'] = dt.time
+    df['year'] = dt.year
+    df['month_num'] = dt.month
+    df['month'] = dt.month_name()
+    df['day'] = dt.day
+    df['hour'] = dt.hour
+    df['minute'] = dt.minute
+    df['day_name'] = dt.day_name()
 
     # Create period bins
-    df['period'] = df['hour'].apply(lambda h: f"{h:02d}-{'00' if h == 23 else f'{(h + 1)%24:02d}' }")
+    df['period'] = np.array(periods, dtype=object)[df['hour']]
+
+    return df
+
+
+def preprocessor(data, compact=False, fmt=None):
+    if fmt is None:
+        head = data[:1_000_000].split('\n', sample_lines)[:sample_lines]
+        fmt = detect_format(head)
+        if settle_order('\n'.join(head)) is None:
+            fmt = fmt.with_order(settle_order(data) or fmt.order)
+    return add_features(_add_date_parts(_parse_block(data, fmt), compact))
+
+
+def _open_blocks(lines, batch_size, fmt=None):
+    # Raw text blocks of the export, each with the format to parse it with
+    # (detected from the first lines unless given)
+    lines = iter(lines)
+    head = list(islice(lines, sample_lines))
+    if fmt is None:
+        fmt = detect_format(head)
+        if settle_order('\n'.join(head)) is None:
+            # No day above 12 in the sample, so day/month order is still open
+            return _settled_blocks(_blocks(chain(head, lines), batch_size, fmt), fmt)
+    return ((block, fmt) for block in _blocks(chain(head, lines), batch_size, fmt))
+
+
+def _settled_blocks(blocks, fmt):
+    # Blocks are held back until one shows the day/month order; an export
+    # that never does keeps the detected (day-first) order
+    held = []
+    for block in blocks:
+        held.append(block)
+        order = settle_order(block)
+        if order:
+            fmt = fmt.with_order(order)
+            break
+    for block in held:
+        yield block, fmt
+    for block in blocks:
+        yield block, fmt
+
+
+def _blocks(lines, batch_size, fmt):
+    # Blocks hold about batch_size lines and always end on a message
+    # boundary: reading goes on to the next header line, which then starts
+    # the following block, so multi-line messages are never split
+    carry = []
+    while True:
+        with stage('decode') as record:
+            block = carry + list(islice(lines, batch_size))
+            carry = []
+            for line in lines:
+                if fmt.header.match(line):
+                    carry = [line]
+                    break
+                block.append(line)
+            record['rows'] = len(block)
+            block = ''.join(block)
+        if not block:
+            return
+        yield block
+
+
+def _last_time(block, fmt):
+    # Timestamp of the last message in a raw block, read from its last
+    # header line without parsing the rest
+    end = len(block.rstrip('\r\n'))
+    while end > 0:
+        start = block.rfind('\n', 0, end) + 1
+        match = fmt.pattern.match(block, start)
+        if match:
+            return np.datetime64(datetime.strptime(match.group(1).replace('\u202f', ' '), fmt.date_format), 'ns')
+        end = start - 1
+    return None
+
+
+def iter_batches(lines, batch_size=100_000, fmt=None):
+    for block, block_fmt in _open_blocks(lines, batch_size, fmt):
+        batch = _parse_block(block, block_fmt)
+        if len(batch):
+            yield batch
+
+
+def _from_batches(batches, compact):
+    # Keep each batch's columns as arrays and concatenate them once; users
+    # become a categorical per batch so a name is stored once, not per row
+    date_times, users, messages = [], [], []
+    for batch in batches:
+        date_times.append(batch['date_time'].to_numpy())
+        users.append(batch['user'].astype('category'))
+        messages.append(batch['message'])
+    if not messages:
+        df = pd.DataFrame({
+            'date_time': np.array([], dtype='datetime64[ns]'),
+            'user': pd.Series([], dtype=str),
+            'message': pd.Series([], dtype=str),
+        })
+        return add_features(_add_date_parts(df, compact))
+
+    user = pd.Series(union_categoricals(users, sort_categories=True))
+    df = pd.DataFrame({
+        'date_time': np.concatenate(date_times),
+        'user': user if compact else user.astype(str),
+        'message': pd.concat(messages, ignore_index=True),
+    })
+    return add_features(_add_date_parts(df, compact))
+
+
+def preprocess_stream(lines, batch_size=100_000, compact=False, fmt=None):
+    # Bounded-memory variant of preprocessor() for a text file object or any
+    # iterable of lines; only one batch of raw text is held at a time.
+    return _from_batches(iter_batches(lines, batch_size, fmt), compact)
+
+
+def preprocess_after(lines, last_time, boundary, batch_size=100_000, compact=False, fmt=None):
+    # Only the messages of an export that follow an already parsed copy of
+    # the chat ending at `last_time`. `boundary` lists the (user, message)
+    # pairs stored at last_time; the export must repeat all of them, which
+    # is how an overlapping export of the same chat is recognized. Blocks
+    # ending before last_time are skipped without being parsed. Returns None
+    # when the export does not overlap, so the caller parses it in full.
+    blocks = _open_blocks(lines, batch_size, fmt)
+    last_time = np.datetime64(last_time, 'ns')
+    expected = Counter(boundary)
+    missing = sum(expected.values())
+
+    def batches():
+        nonlocal missing
+        started = False
+        for block, fmt in blocks:
+            if not started:
+                block_end = _last_time(block, fmt)
+                if block_end is not None and block_end < last_time:
+                    continue
+            batch = _parse_block(block, fmt)
+            if not len(batch):
+                continue
+            started = True
+            times = batch['date_time'].to_numpy()
+            keep = times > last_time
+            # The export repeats the boundary messages before the new ones
+            for i in np.flatnonzero(times == last_time):
+                fingerprint = (batch['user'].iat[i], batch['message'].iat[i])
+                if expected[fingerprint] > 0:
+                    expected[fingerprint] -= 1
+                    missing -= 1
+                else:
+                    keep[i] = True
+            if missing and (times > last_time).any():
+                return
+            yield batch[keep]
 
-    return df
\ No newline at end of file
+    df = _from_batches(batches(), compact)
+    return None if missing else df
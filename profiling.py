@@ -0,0 +1,102 @@
+import json
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+import pandas as pd
+
+# Per-stage timing: `with stage('regex', rows=n):` measures wall time and the
+# change in resident memory, logs one JSON line to the 'profiling' logger and
+# appends the record to every collect() list open on this thread.
+logger = logging.getLogger('profiling')
+_local = threading.local()
+_page_size = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def rss_mb():
+    # Current resident set size; falls back to the peak where /proc is missing
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _page_size / 1024 ** 2
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 ** 2 if sys.platform == 'darwin' else 1024)
+
+
+def _collectors():
+    if not hasattr(_local, 'collectors'):
+        _local.collectors = []
+        _local.depth = 0
+    return _local.collectors
+
+
+@contextmanager
+def stage(name, rows=None):
+    # The yielded record can be updated in the block, e.g. record['rows'] = n
+    collectors = _collectors()
+    record = {'stage': name, 'rows': rows, 'depth': _local.depth}
+    # Listed when the stage starts, so parents come before their sub-stages
+    for records in collectors:
+        records.append(record)
+    start, mem = time.perf_counter(), rss_mb()
+    _local.depth += 1
+    try:
+        yield record
+    finally:
+        _local.depth -= 1
+        record['seconds'] = round(time.perf_counter() - start, 6)
+        record['mem_delta_mb'] = round(rss_mb() - mem, 2)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps(record))
+
+
+@contextmanager
+def collect():
+    # Gathers the records of every stage finished inside the block
+    records = []
+    _collectors().append(records)
+    try:
+        yield records
+    finally:
+        _local.collectors.remove(records)
+
+
+def timed(func, name=None):
+    # Wraps func in a stage; rows is the length of its DataFrame/ChatIndex argument
+    name = name or f'{func.__module__}.{func.__name__}'
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        rows = next((len(arg) for arg in args if hasattr(arg, 'positions') or isinstance(arg, pd.DataFrame)), None)
+        with stage(name, rows=rows):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+class Instrumented:
+    # Module proxy whose public functions run inside a stage each
+    def __init__(self, module):
+        self._module = module
+
+    def __getattr__(self, name):
+        value = getattr(self._module, name)
+        if callable(value) and not name.startswith('_') and not isinstance(value, type):
+            value = timed(value)
+            setattr(self, name, value)
+        return value
+
+
+def summary(records):
+    # One row per stage name, in order of first appearance
+    if not records:
+        return pd.DataFrame(columns=['stage', 'depth', 'calls', 'rows', 'seconds', 'mem_delta_mb'])
+    frame = pd.DataFrame(records)
+    frame['calls'] = 1
+    return frame.groupby('stage', sort=False).agg(
+        depth=('depth', 'min'), calls=('calls', 'sum'), rows=('rows', 'sum'),
+        seconds=('seconds', 'sum'), mem_delta_mb=('mem_delta_mb', 'sum'),
+    ).reset_index()
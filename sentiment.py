@@ -0,0 +1,145 @@
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+import numpy as np
+import pandas as pd
+from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+
+# One analyzer per process; pool workers build their own in _init_worker
+_analyzer = None
+
+
+def _init_worker():
+    global _analyzer
+    _analyzer = SentimentIntensityAnalyzer()
+
+
+def _score_chunk(messages):
+    if _analyzer is None:
+        _init_worker()
+    return [_analyzer.polarity_scores(message)['compound'] for message in messages]
+
+
+def score_messages(messages, workers=None, chunk_size=5_000, min_parallel=20_000):
+    # VADER compound score per message. Large inputs are split into chunks and
+    # scored in a process pool; small ones (or workers=1) run in-process.
+    messages = list(messages)
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if workers <= 1 or len(messages) < min_parallel:
+        return np.array(_score_chunk(messages), dtype=float)
+
+    chunks = [messages[i:i + chunk_size] for i in range(0, len(messages), chunk_size)]
+    # Workers are spawned, not forked: forking a multithreaded process (the
+    # Streamlit server) can deadlock the child on a lock held by another thread
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), initializer=_init_worker,
+                             mp_context=multiprocessing.get_context('spawn')) as pool:
+        scores = pool.map(_score_chunk, chunks)
+        return np.fromiter(chain.from_iterable(scores), dtype=float, count=len(messages))
+
+
+def label(compound):
+    compound = np.asarray(compound, dtype=float)
+    return np.select([compound >= 0.05, compound <= -0.05], ['Positive', 'Negative'], 'Neutral')
+
+
+def message_keys(messages):
+    # Stable 64-bit hash of each message text (vectorized, same across runs)
+    return pd.util.hash_pandas_object(pd.Series(messages), index=False).to_numpy().view(np.int64)
+
+
+class ScoreStore:
+    # Compound scores keyed by message-text hash: an in-memory LRU of
+    # max_entries, backed by an optional SQLite file that drops its least
+    # recently used rows beyond max_disk_entries.
+
+    def __init__(self, path=None, max_entries=1_000_000, max_disk_entries=10_000_000):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self._scores = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS scores (key INTEGER PRIMARY KEY, compound REAL, used REAL)'
+            )
+            self._db.execute('CREATE INDEX IF NOT EXISTS scores_used ON scores (used)')
+            self._db.commit()
+
+    def scores(self, messages, workers=None):
+        messages = pd.Series(messages)
+        codes, keys = pd.factorize(message_keys(messages))
+        # One representative message per distinct text
+        first = np.empty(len(keys), dtype=np.int64)
+        first[codes[::-1]] = np.arange(len(codes))[::-1]
+
+        with self._lock:
+            unique_scores = self._lookup(keys)
+        # Scoring runs outside the lock, so other callers' lookups (cache hits
+        # included) don't wait for a long VADER run; two callers may score the
+        # same new text, which stores the same score twice
+        missing = np.flatnonzero(np.isnan(unique_scores))
+        if len(missing):
+            unique_scores[missing] = score_messages(messages.iloc[first[missing]], workers=workers)
+            with self._lock:
+                self._store(keys[missing], unique_scores[missing])
+
+        return unique_scores[codes]
+
+    def _lookup(self, keys):
+        scores = np.full(len(keys), np.nan)
+        not_cached = []
+        for i, key in enumerate(keys.tolist()):
+            score = self._scores.get(key)
+            if score is None:
+                not_cached.append(i)
+            else:
+                self._scores.move_to_end(key)
+                scores[i] = score
+
+        if self._db is not None and not_cached:
+            now = time.time()
+            for start in range(0, len(not_cached), 500):
+                chunk = [keys[i].item() for i in not_cached[start:start + 500]]
+                marks = ','.join('?' * len(chunk))
+                rows = self._db.execute(f'SELECT key, compound FROM scores WHERE key IN ({marks})', chunk).fetchall()
+                self._db.execute(f'UPDATE scores SET used = ? WHERE key IN ({marks})', [now, *chunk])
+                found = dict(rows)
+                for i, key in zip(not_cached[start:start + 500], chunk):
+                    if key in found:
+                        scores[i] = found[key]
+                        self._remember(key, found[key])
+            self._db.commit()
+
+        return scores
+
+    def _store(self, keys, scores):
+        items = list(zip(keys.tolist(), scores.tolist()))
+        for key, score in items:
+            self._remember(key, score)
+
+        if self._db is not None:
+            now = time.time()
+            self._db.executemany('INSERT OR REPLACE INTO scores VALUES (?, ?, ?)', [(k, s, now) for k, s in items])
+            excess = self._db.execute('SELECT COUNT(*) FROM scores').fetchone()[0] - self.max_disk_entries
+            if excess > 0:
+                self._db.execute(
+                    'DELETE FROM scores WHERE key IN (SELECT key FROM scores ORDER BY used LIMIT ?)', (excess,)
+                )
+            self._db.commit()
+
+    def _remember(self, key, score):
+        self._scores[key] = score
+        self._scores.move_to_end(key)
+        while len(self._scores) > self.max_entries:
+            self._scores.popitem(last=False)
+
+
+default_store = ScoreStore()
@@ -0,0 +1,81 @@
+import copy
+from functools import cached_property
+import numpy as np
+import pandas as pd
+
+
+class TimeCube:
+    # Dense message counts per (user code, calendar day, hour of day), built
+    # with a single bincount. Every timeline and activity chart is a reduction
+    # of one user's (or the summed) day x hour grid, so its cost depends on
+    # the chat's span in days rather than on its number of messages.
+
+    def __init__(self, date_time, codes=None, n_users=1):
+        date_time = pd.Series(date_time)
+        days = date_time.to_numpy().astype('datetime64[D]')
+        if codes is None:
+            codes = np.zeros(len(days), dtype=np.int64)
+
+        self.first_day = days.min() if len(days) else np.datetime64('1970-01-01', 'D')
+        day_index = (days - self.first_day).astype(np.int64)
+        self.n_days = int(day_index.max()) + 1 if len(days) else 0
+
+        flat = (np.asarray(codes, dtype=np.int64) * self.n_days + day_index) * 24 + date_time.dt.hour.to_numpy()
+        counts = np.bincount(flat, minlength=n_users * self.n_days * 24)
+        self._set_counts(self.first_day, counts.astype(np.int32).reshape(n_users, self.n_days, 24))
+
+    def _set_counts(self, first_day, counts):
+        self.first_day, self.counts = first_day, counts
+        self.n_days = counts.shape[1]
+        self.__dict__.pop('overall', None)
+
+        # Calendar attributes of each day on the cube's day axis
+        self.dates = pd.DatetimeIndex(self.first_day + np.arange(self.n_days))
+        self.year = self.dates.year.to_numpy()
+        self.month = self.dates.month.to_numpy()
+        self.day = self.dates.day.to_numpy()
+        self.weekday = self.dates.dayofweek.to_numpy()
+
+    def extended(self, date_time, codes=None, n_users=1):
+        # A cube with more messages counted in; only those are binned, and
+        # the day and user axes grow to cover them
+        new = TimeCube(date_time, codes, n_users)
+        if not new.n_days:
+            first_day, n_days = self.first_day, self.n_days
+        elif not self.n_days:
+            first_day, n_days = new.first_day, new.n_days
+        else:
+            first_day = min(self.first_day, new.first_day)
+            n_days = int((max(self.first_day + self.n_days, new.first_day + new.n_days) - first_day).astype(np.int64))
+        counts = np.zeros((max(n_users, len(self.counts)), n_days, 24), dtype=np.int32)
+        for cube in (self, new):
+            offset = int((cube.first_day - first_day).astype(np.int64)) if cube.n_days else 0
+            counts[:len(cube.counts), offset:offset + cube.n_days] += cube.counts
+        extended = copy.copy(self)
+        extended._set_counts(first_day, counts)
+        return extended
+
+    def window(self, start, stop, codes=None):
+        # Cube of days [start, stop) of this one, for the given user codes
+        # (in that order) or all of them
+        counts = self.counts[:, start:stop] if codes is None else self.counts[codes, start:stop]
+        window = copy.copy(self)
+        window._set_counts(self.first_day + start, counts)
+        return window
+
+    @cached_property
+    def overall(self):
+        return self.counts.sum(axis=0)
+
+    def grid(self, code=None):
+        # Day x hour counts of one user code, or of everyone when code is None
+        return self.overall if code is None else self.counts[code]
+
+    def empty_grid(self):
+        return np.zeros((self.n_days, 24), dtype=np.int32)
+
+    def weekday_hour(self, grid):
+        # 7 x 24 counts by day of week (Monday first) and hour
+        out = np.zeros((7, 24), dtype=np.int64)
+        np.add.at(out, self.weekday, grid)
+        return out
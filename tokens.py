@@ -0,0 +1,177 @@
+import copy
+import re
+from functools import cached_property
+import numpy as np
+import pandas as pd
+from wordcloud import STOPWORDS
+
+# WordCloud's default tokenizer
+cloud_word = re.compile(r"\w[\w']*")
+
+
+def load_stop_words(path='stop_hinglish.txt'):
+    with open(path, 'r', encoding='utf-8') as f:
+        return set(f.read().lower().split())
+
+
+def _distinct_counts(offsets, token_ids, width):
+    # Distinct (case-sensitive) tokens per message, via unique
+    # (message, token) pairs
+    width = max(width, 1)
+    n = len(offsets) - 1
+    pairs = np.repeat(np.arange(n, dtype=np.int64), np.diff(offsets)) * width + token_ids
+    pairs.sort()
+    distinct = np.ones(len(pairs), dtype=bool)
+    distinct[1:] = pairs[1:] != pairs[:-1]
+    return np.bincount(pairs[distinct] // width, minlength=n)
+
+
+class TokenStore:
+    # Whitespace tokens of every message, encoded once per chat. Token ids
+    # index `vocab` (case preserved) and message i owns
+    # token_ids[offsets[i]:offsets[i + 1]]. `lower_ids` folds a token id to its
+    # lowercase id in `lower_vocab`, which `stop_mask` marks as stop words.
+
+    def __init__(self, messages, n_words=None, stop_words=None, chunk_size=200_000):
+        if stop_words is None:
+            stop_words = load_stop_words()
+        self.stop_words = stop_words
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.token_ids = np.zeros(0, dtype=np.int32)
+        self.vocab = np.zeros(0, dtype=object)
+        self.lower_ids = np.zeros(0, dtype=np.int32)
+        self.lower_vocab = np.zeros(0, dtype=object)
+        self.stop_mask = np.zeros(0, dtype=bool)
+        self._add(messages, n_words, chunk_size)
+
+    def extended(self, messages, n_words=None, chunk_size=200_000):
+        # A store of these messages followed by `messages`. Only the new text
+        # is tokenized; existing ids keep their meaning, so counts computed
+        # for earlier messages stay valid.
+        store = copy.copy(self)
+        store.__dict__.pop('cloud_terms', None)
+        unique = store.__dict__.pop('unique_per_message', None)
+        store._add(messages, n_words, chunk_size)
+        if unique is not None:
+            start = len(self.token_ids)
+            store.unique_per_message = np.concatenate([unique, _distinct_counts(
+                store.offsets[len(self):] - start, store.token_ids[start:], len(store.vocab))])
+        return store
+
+    def window(self, start, stop):
+        # Store of messages [start, stop) sharing this one's vocabulary: the
+        # token ids are a view, and vocabulary-level caches stay valid
+        store = copy.copy(self)
+        store.offsets = self.offsets[start:stop + 1] - self.offsets[start]
+        store.token_ids = self.token_ids[self.offsets[start]:self.offsets[stop]]
+        if 'unique_per_message' in self.__dict__:
+            store.unique_per_message = self.unique_per_message[start:stop]
+        return store
+
+    def _add(self, messages, n_words, chunk_size):
+        messages = pd.Series(messages)
+        if n_words is None:
+            n_words = [len(m.split()) for m in messages]
+        n_words = np.asarray(n_words, dtype=np.int64)
+        self.offsets = np.concatenate([self.offsets, self.offsets[-1] + np.cumsum(n_words)])
+
+        # Tokenize in chunks of messages: the joined text is split in C and
+        # factorized, and only each chunk's distinct tokens touch the vocabulary
+        vocab = {token: i for i, token in enumerate(self.vocab)}
+        chunks = [self.token_ids]
+        for start in range(0, len(messages), chunk_size):
+            tokens = "\n".join(messages.iloc[start:start + chunk_size]).split()
+            codes, uniques = pd.factorize(np.array(tokens, dtype=object))
+            remap = np.fromiter((vocab.setdefault(t, len(vocab)) for t in uniques), dtype=np.int32, count=len(uniques))
+            chunks.append(remap[codes])
+        self.token_ids = np.concatenate(chunks)
+        new_vocab = list(vocab)[len(self.vocab):]
+        self.vocab = np.concatenate([self.vocab, np.array(new_vocab, dtype=object)])
+
+        lower = {token: i for i, token in enumerate(self.lower_vocab)}
+        lower_ids = np.fromiter((lower.setdefault(t.lower(), len(lower)) for t in new_vocab), dtype=np.int32, count=len(new_vocab))
+        new_lower = list(lower)[len(self.lower_vocab):]
+        self.lower_ids = np.concatenate([self.lower_ids, lower_ids])
+        self.lower_vocab = np.concatenate([self.lower_vocab, np.array(new_lower, dtype=object)])
+        self.stop_mask = np.concatenate([self.stop_mask, np.fromiter(
+            (t in self.stop_words for t in new_lower), dtype=bool, count=len(new_lower))])
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def ids(self, positions=None):
+        # Token ids of the messages at `positions` (all messages when None)
+        if positions is None:
+            return self.token_ids
+        positions = np.asarray(positions)
+        starts = self.offsets[positions]
+        lengths = self.offsets[positions + 1] - starts
+        # Expand each [start, start + length) run into one flat gather index
+        run_offsets = np.cumsum(lengths) - lengths
+        return self.token_ids[np.repeat(starts - run_offsets, lengths) + np.arange(lengths.sum())]
+
+    def word_counts(self, positions=None, skip_stop_words=True):
+        # Lowercase word frequencies as a bincount over `lower_vocab`
+        counts = np.bincount(self.lower_ids[self.ids(positions)], minlength=len(self.lower_vocab))
+        if skip_stop_words:
+            counts[self.stop_mask] = 0
+        return counts
+
+    def most_common(self, positions=None, n=20):
+        # Most frequent first, equal counts alphabetically, so the top n is
+        # the same whatever the vocabulary order (whole chat or a selection)
+        counts = self.word_counts(positions)
+        top = np.flatnonzero(counts)
+        if len(top) > n:
+            # Only words tied with or above the n-th count can make the cut
+            top = top[counts[top] >= np.partition(counts[top], len(top) - n)[len(top) - n]]
+        top = top[np.lexsort((self.lower_vocab[top], -counts[top]))][:n]
+        return list(zip(self.lower_vocab[top], counts[top]))
+
+    @cached_property
+    def cloud_terms(self):
+        # Lowercase tokens split into words the way WordCloud.generate would
+        # tokenize them (punctuation dropped, trailing 's removed, numbers and
+        # both stop word lists skipped): a CSR map from lower id to ids in
+        # the returned vocabulary
+        stop_words = self.stop_words | {word.lower() for word in STOPWORDS}
+        vocab, term_ids = {}, []
+        lengths = np.zeros(len(self.lower_vocab), dtype=np.int64)
+        for i, token in enumerate(self.lower_vocab):
+            for word in cloud_word.findall(token):
+                if word.endswith("'s"):
+                    word = word[:-2]
+                if word.isdigit() or word in stop_words:
+                    continue
+                term_ids.append(vocab.setdefault(word, len(vocab)))
+                lengths[i] += 1
+        # Singular form of each plural term ('cats' -> 'cat'), or -1
+        singular = np.array([vocab.get(word[:-1], -1) if word.endswith('s') and not word.endswith('ss') else -1
+                             for word in vocab], dtype=np.int64)
+        return lengths, np.array(term_ids, dtype=np.int64), np.array(list(vocab), dtype=object), singular
+
+    def cloud_counts(self, positions=None):
+        # Word cloud frequencies as a bincount over the cloud_terms vocabulary,
+        # with plurals folded into their singular when both occur
+        lengths, term_ids, vocab, singular = self.cloud_terms
+        weights = np.repeat(self.word_counts(positions), lengths)
+        counts = np.bincount(term_ids, weights=weights, minlength=len(vocab)).astype(np.int64)
+        plural = np.flatnonzero((singular >= 0) & (counts > 0))
+        plural = plural[counts[singular[plural]] > 0]
+        np.add.at(counts, singular[plural], counts[plural])
+        counts[plural] = 0
+        return counts, vocab
+
+    @cached_property
+    def unique_per_message(self):
+        return _distinct_counts(self.offsets, self.token_ids, len(self.vocab))
+
+    def lexical_richness(self, positions=None):
+        if positions is None:
+            total = len(self.token_ids)
+            unique = self.unique_per_message.sum()
+        else:
+            positions = np.asarray(positions)
+            total = (self.offsets[positions + 1] - self.offsets[positions]).sum()
+            unique = self.unique_per_message[positions].sum()
+        return unique / total if total else 0
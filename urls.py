@@ -0,0 +1,43 @@
+from collections import Counter
+from functools import lru_cache
+from urllib.parse import urlsplit
+import numpy as np
+from urlextract import URLExtract
+
+extractor = URLExtract()
+
+# Anything URLExtract can find has a scheme, a www. prefix, a dot followed by
+# a TLD or an IPv4 address, so other messages never reach the full extractor
+candidate_pattern = r'://|www\.|\.[^\s\d.,]{2}|\d\.\d+\.\d+\.\d'
+
+
+@lru_cache(maxsize=100_000)
+def find_urls(message):
+    return tuple(extractor.find_urls(message))
+
+
+def candidates(messages):
+    return messages.str.contains(candidate_pattern, regex=True).to_numpy(dtype=bool)
+
+
+def count_urls(messages):
+    counts = np.zeros(len(messages), dtype=np.int32)
+    positions = np.flatnonzero(candidates(messages))
+    counts[positions] = [len(find_urls(messages.iat[i])) for i in positions]
+    return counts
+
+
+def find_links(messages):
+    return [url for i in np.flatnonzero(candidates(messages)) for url in find_urls(messages.iat[i])]
+
+
+def domain(url):
+    try:
+        host = urlsplit(url if '://' in url else f'http://{url}').hostname or ''
+    except ValueError:
+        return ''
+    return host[4:] if host.startswith('www.') else host
+
+
+def domain_counts(messages):
+    return Counter(domain(url) for url in find_links(messages))